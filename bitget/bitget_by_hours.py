@@ -1,3 +1,5 @@
+import os
+import sys
 import asyncio
 import aiohttp
 import requests
@@ -7,10 +9,9 @@ import pandas as pd
 import yaml
 import pymysql
 from contextlib import contextmanager
-import nest_asyncio
 
-# Jupyter/IPython 환경 지원
-nest_asyncio.apply()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import loop_runner
 
 # --- [1] 유틸리티 및 DB 관리 클래스 ---
 def get_current_hour():
@@ -195,7 +196,7 @@ if __name__ == '__main__':
     # 3. 작업 순차 실행
     for gran, m_table, ma_table in jobs:
         print(f"\n--- Starting {gran} Task ---")
-        candles = asyncio.run(fetch_all_candles(markets, 10, curr_kst, granularity=gran))
+        candles = loop_runner.run(fetch_all_candles(markets, 10, curr_kst, granularity=gran), name=f'bitget_{gran}')
         process_market_data(db_mgr, candles, m_table)
         update_ma_data(db_mgr, m_table, ma_table, gran)
 
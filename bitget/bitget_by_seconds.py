@@ -13,129 +13,142 @@ Created on Tue Jan  7 13:09:37 2025
 """
 
 import os
-import yaml
-import json
-from datetime import datetime, timedelta
+import sys
+import asyncio
+from datetime import datetime
 import time
-from contextlib import contextmanager
 
-import redis
 import requests
 import pymysql
-from pymysql import connections
-import pandas as pd
-
-
-class DatabasePool:
-    """데이터베이스 연결 풀 관리 클래스"""
-    def __init__(self, yaml_data, pool_size=5):
-        self.config = {
-            'host': yaml_data['HOST'],
-            'user': yaml_data['USER'],
-            'password': yaml_data['PASSWORD'],
-            'db': 'bithumb',
-            'charset': 'utf8mb4',
-            'autocommit': False,
-            'cursorclass': pymysql.cursors.DictCursor
-        }
-        self.pool_size = pool_size
-        self.connections = []
-        self._create_pool()
-    
-    def _create_pool(self):
-        """연결 풀 생성"""
-        for _ in range(self.pool_size):
-            try:
-                conn = pymysql.connect(**self.config)
-                self.connections.append(conn)
-            except Exception as e:
-                print(f"Connection pool creation error: {e}")
-    
-    @contextmanager
-    def get_connection(self):
-        """연결 풀에서 연결 가져오기"""
-        connection = None
-        try:
-            if self.connections:
-                connection = self.connections.pop()
-                # 연결 상태 확인 및 재연결
-                connection.ping(reconnect=True)
-                yield connection
-            else:
-                # 풀이 비어있으면 새로운 연결 생성
-                connection = pymysql.connect(**self.config)
-                yield connection
-        except Exception as e:
-            print(f"Database connection error: {e}")
-            if connection:
-                try:
-                    connection.rollback()
-                except:
-                    pass
-            raise
-        finally:
-            if connection:
-                try:
-                    # 연결을 풀에 반환
-                    if len(self.connections) < self.pool_size:
-                        self.connections.append(connection)
-                    else:
-                        connection.close()
-                except:
-                    pass
+import orjson
+import websockets
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import loop_runner
+from db_pool import DatabasePool, load_db_settings
+from bulk_writer import BulkWriter
+from tick_scheduler import TickScheduler
 
 
-def get_current_prices(formatted_time):
+BITGET_WS_URI = "wss://ws.bitget.com/v2/ws/public"
+PRODUCT_TYPE = 'USDT-FUTURES'
+SYMBOLS_PER_CONNECTION = 100   # 연결 하나가 구독할 심볼 수
+SUBSCRIBE_MAX_BYTES = 4000     # 구독 메시지 하나의 최대 크기 (빗겟은 채널 목록이 4096바이트를 넘는 요청을 거절)
+PING_INTERVAL = 25             # 빗겟 권장 30초 주기 "ping" (2분 동안 없으면 연결을 끊음)
+RECV_IDLE_TIMEOUT = 10         # 이 시간 동안 어떤 메시지도 없으면 멈춘(half-open) 연결로 보고 재연결(초)
+STALE_AFTER = 30               # 이 시간 동안 갱신되지 않은 심볼은 기록하지 않음(초)
+SYMBOL_REFRESH_INTERVAL = 600  # 심볼 목록 재조회 주기(초), 신규 상장/상장 폐지 반영
+
+# 중복 키면 가격만 갱신 (기록 방식은 bulk_writer.BULK_STRATEGY)
+market_writer = BulkWriter('tb_market_bitget', ('log_dt', 'market', 'price', 'volume', 'funding_rate'),
+                           update_columns=('price',))
+
+
+def get_usdt_futures_tickers():
+    """USDT-FUTURES 전체 티커 조회 (심볼 목록과 캐시 초기값, SYMBOL_REFRESH_INTERVAL마다)"""
     url = "https://api.bitget.com/api/v2/mix/market/tickers"
-    try:
-        # 최적화 포인트 1: 직접 join으로 markets 처리
-        
-        params = {'productType': 'USDT-FUTURES'}
-        response = requests.Session().get(url, params=params)
-        response_data = response.json()
-        future_data = None
-        if response_data['msg'] == 'success':
-            future_data = response_data['data']
-            print("내려받은 데이터:", len(future_data))
-            
-            old_dic = dict()
-            for data in future_data:
-                
-                market = data['symbol']
-                price = float(data['markPrice'])
-                volume = float(data['quoteVolume'])
-                funding_rate = float(data['fundingRate'])
-                
-                old_dic[market] = [price, volume, funding_rate]
-        # 최적화 포인트 2: Dictionary Comprehension 사용
-        
-        return old_dic
-            
-    except Exception as e:
-        print(f"Error fetching prices: {e}")
-        return {}
+    response = requests.get(url, params={'productType': PRODUCT_TYPE}, timeout=10)
+    response_data = response.json()
+    if response_data['msg'] != 'success':
+        raise RuntimeError(f"Bitget tickers error: {response_data['msg']}")
+    print("내려받은 데이터:", len(response_data['data']))
+    return response_data['data']
 
 
-def get_current_time(current_time):
-    # 현재 시간을 10초 단위로 내림
-    rounded_seconds = (current_time.second // 10) * 10
-    rounded_time = current_time.replace(second=rounded_seconds, microsecond=0) - timedelta(seconds=10)
-    formatted_time = rounded_time.strftime('%Y-%m-%d %H:%M:%S')
-    return formatted_time
+class TickerCache:
+    """심볼별 최신 [markPrice, quoteVolume(24h), fundingRate]와 갱신 시각 보관 (웹소켓 메시지마다 갱신)"""
 
+    def __init__(self):
+        self.values = dict()
+        self.updated = dict()   # symbol -> 마지막 갱신 시각 (monotonic)
+        self.updates = 0
 
-def wait_until_next_interval():
-    """
-    다음 10초 구간의 시작까지 대기
-    ex) 현재 23초면 30초가 될 때까지 대기
-    """
-    now = datetime.now()
-    next_interval = now + timedelta(seconds=10 - now.second % 10)
-    next_interval = next_interval.replace(microsecond=0)
-    sleep_seconds = (next_interval - now).total_seconds()
-    if sleep_seconds > 0:
-        time.sleep(sleep_seconds)
+    def update(self, ticker):
+        try:
+            symbol = ticker.get('instId') or ticker['symbol']
+            self.values[symbol] = [
+                float(ticker['markPrice']), float(ticker['quoteVolume']), float(ticker['fundingRate'])]
+            self.updated[symbol] = time.monotonic()
+            self.updates += 1
+        except (KeyError, ValueError, TypeError):
+            pass
+
+    def retain(self, symbols):
+        """상장 폐지된 심볼 제거"""
+        for symbol in set(self.values) - set(symbols):
+            del self.values[symbol]
+            self.updated.pop(symbol, None)
+
+    def snapshot(self, max_age=STALE_AFTER):
+        """max_age초 안에 갱신된 심볼만 (스냅샷, 오래된 심볼 수) 반환"""
+        now = time.monotonic()
+        fresh = {symbol: list(value) for symbol, value in self.values.items()
+                 if now - self.updated[symbol] <= max_age}
+        return fresh, len(self.values) - len(fresh)
+
+
+def subscribe_messages(symbols, max_bytes=SUBSCRIBE_MAX_BYTES):
+    """심볼 목록을 max_bytes를 넘지 않는 구독 메시지 여러 개로 나눔 (메시지마다 심볼 수도 반환)"""
+    messages = []
+    batch = []
+    for symbol in symbols:
+        arg = {'instType': PRODUCT_TYPE, 'channel': 'ticker', 'instId': symbol}
+        if batch and len(orjson.dumps({'op': 'subscribe', 'args': batch + [arg]})) > max_bytes:
+            messages.append((orjson.dumps({'op': 'subscribe', 'args': batch}), len(batch)))
+            batch = []
+        batch.append(arg)
+    if batch:
+        messages.append((orjson.dumps({'op': 'subscribe', 'args': batch}), len(batch)))
+    return messages
+
+
+async def bitget_ws_client(symbols, cache, label):
+    """심볼 묶음 하나의 ticker 채널을 구독하고 받는 대로 캐시를 갱신 (끊기면 재연결)"""
+    messages = subscribe_messages(symbols)
+    while True:
+        try:
+            async with websockets.connect(BITGET_WS_URI, ping_interval=None) as websocket:
+                for index, (message, count) in enumerate(messages, 1):
+                    await websocket.send(message)
+                    print(f"[{label}] Sent subscribe batch {index}/{len(messages)}: {count} symbols, {len(message)} bytes")
+                # 구독 응답(심볼마다 하나)이 모두 오면 한 번 출력, 거절된 심볼은 오류 응답마다 출력
+                unacked = set(symbols)
+
+                async def keepalive():
+                    while True:
+                        await asyncio.sleep(PING_INTERVAL)
+                        await websocket.send("ping")
+
+                ping_task = asyncio.create_task(keepalive())
+                try:
+                    while True:
+                        try:
+                            message = await asyncio.wait_for(websocket.recv(), RECV_IDLE_TIMEOUT)
+                        except asyncio.TimeoutError:
+                            # half-open 연결: 예외 없이 recv()가 영원히 기다리는 경우 (pong도 오지 않음)
+                            print(f"[{label}] No messages for {RECV_IDLE_TIMEOUT}s, reconnecting")
+                            break
+                        if message == "pong":
+                            continue
+                        data = orjson.loads(message)
+                        event = data.get('event')
+                        if event == 'error':
+                            print(f"[{label}] Subscribe error: {data}")
+                            continue
+                        if event == 'subscribe':
+                            if unacked:
+                                unacked.discard(data.get('arg', {}).get('instId'))
+                                if not unacked:
+                                    print(f"[{label}] All {len(symbols)} subscriptions acknowledged")
+                            continue
+                        for ticker in data.get('data', ()):
+                            cache.update(ticker)
+                finally:
+                    ping_task.cancel()
+            print(f"[{label}] WebSocket connection closed. Attempting to reconnect...")
+        except Exception as e:
+            print(f"[{label}] Connection error: {e}")
+            await asyncio.sleep(5)
 
 
 def insert_market_data(db_pool, total_list):
@@ -143,19 +156,10 @@ def insert_market_data(db_pool, total_list):
     if not total_list:
         return False
         
-    # INSERT IGNORE 또는 ON DUPLICATE KEY UPDATE 사용으로 중복 데이터 처리
-    sql = """
-        INSERT INTO tb_market_bitget (log_dt, market, price,volume,funding_rate) 
-        VALUES (%s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE 
-        price = VALUES(price)
-    """
-    
     try:
         with db_pool.get_connection() as connection:
             with connection.cursor() as cursor:
-                # executemany는 이미 배치 처리되므로 그대로 사용
-                cursor.executemany(sql, total_list)
+                market_writer.write(cursor, total_list)
                 connection.commit()
                 print(f"[{datetime.now()}]: Successfully inserted {len(total_list)} records")
                 return True
@@ -164,40 +168,81 @@ def insert_market_data(db_pool, total_list):
         return False
 
 
-def main():
-    """메인 실행 함수"""
-    #설정 파일 로드
-    file_path = "/home/ubuntu/baseball_project/db_settings.yml"
-    with open(file_path, 'r', encoding='utf-8') as file:
-        yaml_data = yaml.safe_load(file)
-        yaml_data = yaml_data['BASEBALL']
-    
-    # 데이터베이스 연결 풀 생성
-    db_pool = DatabasePool(yaml_data, pool_size=3)
-    
+async def snapshot_writer(db_pool, cache):
+    """10초 격자마다 캐시 스냅샷을 tb_market_bitget에 기록 (DB 쓰기는 별도 스레드)"""
+    # 스냅샷은 지금 값이므로 늦어진 틱은 지난 봉으로 기록하지 않고 missed로 건너뜀
+    scheduler = TickScheduler('bitget_by_seconds')
     while True:
         try:
-            wait_until_next_interval()
-            formatted_time = get_current_time(datetime.now())
-            
-            market_dic = get_current_prices(formatted_time)
-            
-            # 데이터 준비 최적화
+            tick = await scheduler.next_tick_async()
+            formatted_time = tick.formatted_time
+            # 웹소켓이 멈춰 갱신되지 않은 심볼은 지난 값을 새 시각으로 기록하지 않음
+            market_dic, stale = cache.snapshot()
+
             total_list = []
             for key, value in market_dic.items():
                 total_list.append([formatted_time, key] + value)
-            
-            
+
             #배치 INSERT 실행
             if total_list:
-                success = insert_market_data(db_pool, total_list)
+                success = await asyncio.to_thread(insert_market_data, db_pool, total_list)
                 if not success:
                     print(f"Failed to insert data at {formatted_time}")
-                    
+            print(f"[{formatted_time}] ticker updates since start: {cache.updates}, "
+                  f"stale symbols: {stale}, skew {tick.skew * 1000:.0f}ms")
+
         except Exception as e:
             print(f"Main loop error: {e}")
-            time.sleep(1)  # 오류 발생 시 잠시 대기
+            await asyncio.sleep(1)  # 오류 발생 시 잠시 대기
+
+
+def start_clients(symbols, cache):
+    return [asyncio.create_task(bitget_ws_client(symbols[i:i + SYMBOLS_PER_CONNECTION], cache,
+                                                 f"bitget-{i // SYMBOLS_PER_CONNECTION}"))
+            for i in range(0, len(symbols), SYMBOLS_PER_CONNECTION)]
+
+
+async def run(db_pool):
+    # 값은 웹소켓으로만 갱신하고, REST는 SYMBOL_REFRESH_INTERVAL마다 심볼 목록 확인에만 사용
+    cache = TickerCache()
+    tickers = get_usdt_futures_tickers()
+    for ticker in tickers:
+        cache.update(ticker)
+    symbols = sorted(ticker['symbol'] for ticker in tickers)
+    clients = start_clients(symbols, cache)
+    writer = asyncio.create_task(snapshot_writer(db_pool, cache))
+
+    while not writer.done():
+        await asyncio.sleep(SYMBOL_REFRESH_INTERVAL)
+        try:
+            tickers = await asyncio.to_thread(get_usdt_futures_tickers)
+        except Exception as e:
+            print(f"Symbol refresh failed: {e}")
+            continue
+        latest = sorted(ticker['symbol'] for ticker in tickers)
+        if latest == symbols:
+            continue
+        listed, delisted = set(latest) - set(symbols), set(symbols) - set(latest)
+        print(f"Symbols changed: listed {sorted(listed)}, delisted {sorted(delisted)}")
+        cache.retain(latest)
+        for ticker in tickers:
+            if ticker['symbol'] in listed:
+                cache.update(ticker)
+        # 묶음 경계가 바뀌므로 새 목록으로 다시 연결
+        for client in clients:
+            client.cancel()
+        clients = start_clients(latest, cache)
+        symbols = latest
+    writer.result()
+
+
+def main():
+    """메인 실행 함수"""
+    # 데이터베이스 연결 풀 생성 (설정 파일은 한 번만 읽음)
+    db_pool = DatabasePool(load_db_settings(), db='bithumb', pool_size=3, cursorclass=pymysql.cursors.DictCursor,
+                           local_infile=market_writer.local_infile)
+    loop_runner.run(run(db_pool), name='bitget_by_seconds')
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
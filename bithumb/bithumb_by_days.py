@@ -6,6 +6,8 @@ Created on Thu Sep 11 17:00:57 2025
 """
 
 #%%
+import os
+import sys
 import asyncio
 import aiohttp
 import requests
@@ -14,8 +16,9 @@ import time
 import pandas as pd
 import yaml
 import pymysql
-import nest_asyncio
-nest_asyncio.apply()
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import loop_runner
 
 
 def get_krw_markets():
@@ -113,7 +116,7 @@ async def main_async():
 
 # 메인 함수 호출 및 실행
 if __name__ == '__main__':
-    old_list, start_time = asyncio.run(main_async())
+    old_list, start_time = loop_runner.run(main_async(), name='bithumb_by_days')
 
 #%%
 file_path = "/home/ubuntu/baseball_project/db_settings.yml"  # YAML 파일이 있는 폴더 경로
@@ -6,76 +6,28 @@ Created on Tue Jan  7 13:09:37 2025
 """
 
 import os
-import yaml
+import sys
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
-from contextlib import contextmanager
 
 import redis
 import requests
 import pymysql
-from pymysql import connections
-import pandas as pd
-
-
-class DatabasePool:
-    """데이터베이스 연결 풀 관리 클래스"""
-    def __init__(self, yaml_data, pool_size=5):
-        self.config = {
-            'host': yaml_data['HOST'],
-            'user': yaml_data['USER'],
-            'password': yaml_data['PASSWORD'],
-            'db': 'bithumb',
-            'charset': 'utf8mb4',
-            'autocommit': False,
-            'cursorclass': pymysql.cursors.DictCursor
-        }
-        self.pool_size = pool_size
-        self.connections = []
-        self._create_pool()
-    
-    def _create_pool(self):
-        """연결 풀 생성"""
-        for _ in range(self.pool_size):
-            try:
-                conn = pymysql.connect(**self.config)
-                self.connections.append(conn)
-            except Exception as e:
-                print(f"Connection pool creation error: {e}")
-    
-    @contextmanager
-    def get_connection(self):
-        """연결 풀에서 연결 가져오기"""
-        connection = None
-        try:
-            if self.connections:
-                connection = self.connections.pop()
-                # 연결 상태 확인 및 재연결
-                connection.ping(reconnect=True)
-                yield connection
-            else:
-                # 풀이 비어있으면 새로운 연결 생성
-                connection = pymysql.connect(**self.config)
-                yield connection
-        except Exception as e:
-            print(f"Database connection error: {e}")
-            if connection:
-                try:
-                    connection.rollback()
-                except:
-                    pass
-            raise
-        finally:
-            if connection:
-                try:
-                    # 연결을 풀에 반환
-                    if len(self.connections) < self.pool_size:
-                        self.connections.append(connection)
-                    else:
-                        connection.close()
-                except:
-                    pass
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_pool import DatabasePool, load_db_settings
+from bulk_writer import BulkWriter
+from tick_scheduler import TickScheduler
+
+
+KEY_PREFIX = 'bithumb:'          # bithumb_websocket.py가 쓰는 Redis 키 접두사
+FLUSH_DELAY = 1                  # 웹소켓 집계기가 버킷을 닫고 Redis에 기록할 때까지 기다리는 시간(초)
+MARKET_REFRESH_INTERVAL = 600    # 마켓 목록 재조회 주기(초)
+MAX_CATCHUP = 3                  # 늦어졌을 때 Redis에 남아 있는 봉을 늦게라도 기록할 최근 틱 수
+
+# 중복 키면 가격만 갱신 (기록 방식은 bulk_writer.BULK_STRATEGY)
+market_writer = BulkWriter('tb_market', ('log_dt', 'market', 'price'), update_columns=('price',))
 
 
 def get_krw_markets():
@@ -90,49 +42,28 @@ def get_krw_markets():
     return krw_markets
 
 
-def get_current_prices(markets, formatted_time):
-    url = "https://api.bithumb.com/v1/ticker"
+def connect_redis():
     try:
-        # 최적화 포인트 1: 직접 join으로 markets 처리
-        len_markets = len(markets)
-        price_total_data = list()
-        for i in range(len_markets//100+1):
-            min_idx = i * 100
-            max_idx = (i+1)*100
-            response = requests.Session().get(url, params={"markets": ",".join(markets[min_idx:max_idx])})
-            price_data = response.json()
-            
-            price_total_data.extend(price_data)
-            print(len(price_data))
-        # 최적화 포인트 2: Dictionary Comprehension 사용
-        return {
-            ticker['market']: {formatted_time: ticker['trade_price']} 
-            for ticker in price_total_data
-        }
-    except Exception as e:
-        print(f"Error fetching prices: {e}")
-        return {}
-
-
-def get_current_time(current_time):
-    # 현재 시간을 10초 단위로 내림
-    rounded_seconds = (current_time.second // 10) * 10
-    rounded_time = current_time.replace(second=rounded_seconds, microsecond=0) - timedelta(seconds=10)
-    formatted_time = rounded_time.strftime('%Y-%m-%d %H:%M:%S')
-    return formatted_time
-
-
-def wait_until_next_interval():
-    """
-    다음 10초 구간의 시작까지 대기
-    ex) 현재 23초면 30초가 될 때까지 대기
-    """
-    now = datetime.now()
-    next_interval = now + timedelta(seconds=10 - now.second % 10)
-    next_interval = next_interval.replace(microsecond=0)
-    sleep_seconds = (next_interval - now).total_seconds()
-    if sleep_seconds > 0:
-        time.sleep(sleep_seconds)
+        r = redis.Redis(
+            host='localhost', 
+            port=6379, 
+            db=0, 
+            decode_responses=True,
+            socket_connect_timeout=5
+        )
+        r.ping()  # Redis 서버 연결 테스트
+        print("Successfully connected to Redis")
+        return r
+    except redis.ConnectionError as e:
+        print(f"Could not connect to Redis: {e}")
+        print("Please make sure Redis server is running")
+        raise
+
+
+def get_closed_prices(r, bucket_ms):
+    """bithumb_websocket이 기록한 10초 봉에서 마켓별 종가 조회 (체결이 없던 마켓은 직전 종가)"""
+    market_stats = r.hgetall(f"{KEY_PREFIX}trade_stats:{bucket_ms}")
+    return {market: json.loads(stats)['close'] for market, stats in market_stats.items()}
 
 
 def insert_market_data(db_pool, total_list):
@@ -140,19 +71,10 @@ def insert_market_data(db_pool, total_list):
     if not total_list:
         return False
         
-    # INSERT IGNORE 또는 ON DUPLICATE KEY UPDATE 사용으로 중복 데이터 처리
-    sql = """
-        INSERT INTO tb_market (log_dt, market, price) 
-        VALUES (%s, %s, %s)
-        ON DUPLICATE KEY UPDATE 
-        price = VALUES(price)
-    """
-    
     try:
         with db_pool.get_connection() as connection:
             with connection.cursor() as cursor:
-                # executemany는 이미 배치 처리되므로 그대로 사용
-                cursor.executemany(sql, total_list)
+                market_writer.write(cursor, total_list)
                 connection.commit()
                 print(f"[{datetime.now()}]: Successfully inserted {len(total_list)} records")
                 return True
@@ -163,28 +85,36 @@ def insert_market_data(db_pool, total_list):
 
 def main():
     """메인 실행 함수"""
-    # 설정 파일 로드
-    file_path = "/home/ubuntu/baseball_project/db_settings.yml"
-    with open(file_path, 'r', encoding='utf-8') as file:
-        yaml_data = yaml.safe_load(file)
-        yaml_data = yaml_data['BASEBALL']
-    
-    # 데이터베이스 연결 풀 생성
-    db_pool = DatabasePool(yaml_data, pool_size=3)
+    # 데이터베이스 연결 풀 생성 (설정 파일은 한 번만 읽음)
+    db_pool = DatabasePool(load_db_settings(), db='bithumb', pool_size=3, cursorclass=pymysql.cursors.DictCursor,
+                           local_infile=market_writer.local_infile)
+    r = connect_redis()
     
+    markets = get_krw_markets()
+    markets_updated = time.monotonic()
+    # 10초 경계 + FLUSH_DELAY마다 직전 봉을 기록 (틱 번호 기준이라 같은 봉을 두 번 기록하지 않음)
+    scheduler = TickScheduler('bithumb_by_seconds', offset=FLUSH_DELAY, max_catchup=MAX_CATCHUP)
     while True:
         try:
-            markets = get_krw_markets()
-            wait_until_next_interval()
-            formatted_time = get_current_time(datetime.now())
+            # 마켓 목록은 가끔만 다시 조회 (매 틱 REST 호출 없음)
+            if time.monotonic() - markets_updated >= MARKET_REFRESH_INTERVAL:
+                markets = get_krw_markets()
+                markets_updated = time.monotonic()
+            tick = scheduler.next_tick()
+            formatted_time = tick.formatted_time
             
-            price_dic = get_current_prices(markets, formatted_time)
+            price_dic = get_closed_prices(r, tick.bucket_ms)
+            if not price_dic:
+                # 봉이 없으면 모든 마켓을 가격 NULL로 기록하지 않고 이 틱을 건너뜀
+                print(f"[{formatted_time}] WARNING: {KEY_PREFIX}trade_stats:{tick.bucket_ms} not found, skipping tick "
+                      f"(is bithumb/bithumb_websocket.py running?)")
+                continue
             
             # 데이터 준비 최적화
             total_list = []
             for market in markets:
                 try:
-                    price = float(price_dic[market][formatted_time])
+                    price = float(price_dic[market])
                 except (KeyError, ValueError, TypeError):
                     price = None
                 
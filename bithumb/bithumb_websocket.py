@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+빗썸 실시간 체결 수집기
+
+빗썸 웹소켓(v1)은 업비트와 같은 구독 형식/SIMPLE 포맷을 쓰므로 upbit_websocket의
+수신 루프와 캔들 엔진을 그대로 사용하고, Redis 키만 'bithumb:' 접두사로 구분한다.
+  bithumb:trade_stats:{ts}, bithumb:trade_volume:{ts}, bithumb:candle_1s:{ts}, bithumb:candle_1m:{ts}
+bithumb_by_seconds.py가 이 10초 봉을 읽어 tb_market에 기록한다.
+"""
+
+import os
+import sys
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import upbit_websocket as ws
+import loop_runner
+
+
+BITHUMB_WS_URI = "wss://ws-api.bithumb.com/websocket/v1"
+BITHUMB_REST_URL = "https://api.bithumb.com/v1"
+METRICS_PORT = 9208   # /metrics 포트, upbit_websocket(9108 + 슬롯)과 같은 호스트에서 겹치지 않도록 따로 둠
+
+
+def get_krw_markets():
+    """빗썸 KRW 마켓의 모든 거래쌍 조회"""
+    url = f"{BITHUMB_REST_URL}/market/all"
+    response = requests.get(url)
+    markets = response.json()
+    # KRW 마켓만 필터링
+    krw_markets = [market['market'] for market in markets if market['market'].startswith('KRW-')]
+    print(f"Total KRW markets: {len(krw_markets)}")
+    return krw_markets
+
+
+def main():
+    markets = get_krw_markets()
+    ws.METRICS_PORT = METRICS_PORT
+    ws.r = ws.connect_redis()
+    loop_runner.run(ws.upbit_ws_client(markets, uri=BITHUMB_WS_URI, exchange='bithumb',
+                                       rest_url=BITHUMB_REST_URL), name='bithumb')
+
+
+if __name__ == "__main__":
+    main()
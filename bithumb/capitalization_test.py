@@ -1,10 +1,13 @@
+import os
+import sys
 import aiohttp
 import asyncio
 import re
 from typing import List, Dict, Any
-import nest_asyncio
-nest_asyncio.apply()
 import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import loop_runner
 async def fetch_market_info(session: aiohttp.ClientSession, code: int) -> Dict[str, Any]:
     """단일 마켓 정보를 비동기로 가져오는 함수"""
     url = f'https://gw.bithumb.com/exchange/v2/trade/info-coin/C{code:04d}-C0100?lang=korean&_=1760549537926&retry=0'
@@ -111,7 +114,7 @@ def create_dataframe(results):
 # 실행
 if __name__ == "__main__":
     # 이벤트 루프 실행
-    results = asyncio.run(main())
+    results = loop_runner.run(main(), name='capitalization')
     
     # 결과를 DataFrame으로 변환하려면:
     # import pandas as pd
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+10초 스냅샷 테이블(tb_market, tb_market_bitget 등) 공용 대량 기록기
+
+틱마다 수백 행을 기록하는 방식을 BULK_STRATEGY로 고른다.
+  - 'executemany': 기존 cursor.executemany, 기본값
+                   pymysql이 INSERT ... VALUES 문을 여러 행 문으로 바꿔 보내므로 이미 배치 처리된다.
+  - 'values'     : 여러 행을 INSERT ... VALUES (...), (...) 문 하나로 직접 만들어 (VALUES_BATCH_ROWS행씩)
+  - 'load_data'  : 행을 탭 구분 텍스트로 만들어 LOAD DATA LOCAL INFILE로 전송
+                   pymysql은 파일 경로로만 보낼 수 있으므로 메모리 파일 시스템(/dev/shm)의 임시 파일을 거친다.
+                   연결에 local_infile=True가 필요하고, 서버에서 막혀 있으면 경고 후 'executemany'로 바꿔 다시 기록
+                   중복 키 행은 건너뛴다(IGNORE).
+update_columns를 주면 중복 키에서 그 열만 갱신한다 (ON DUPLICATE KEY UPDATE).
+'load_data'는 열 단위 갱신을 할 수 없으므로(REPLACE는 행을 지우고 다시 넣어 나머지 열까지 덮어씀)
+update_columns와 함께 고르면 경고 후 'executemany'를 쓴다.
+기본값은 실제 MySQL에서 test/benchmark_bulk_writer.py로 다른 방식이 빠르다는 것을 확인한 뒤에 바꾼다.
+"""
+
+import os
+import tempfile
+from datetime import datetime
+
+import pymysql
+
+
+BULK_STRATEGY = 'executemany'   # 'executemany' / 'values' / 'load_data' ('load_data'는 update_columns가 없는 테이블만)
+VALUES_BATCH_ROWS = 1000     # 'values' 문 하나에 넣는 최대 행 수 (max_allowed_packet 안쪽)
+LOAD_DATA_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None   # 'load_data' 임시 파일 위치
+LOCAL_INFILE_DISABLED = (1148, 2068, 3948)   # 서버/클라이언트에서 LOAD DATA LOCAL이 막혀 있을 때의 오류 코드
+STRATEGIES = ('executemany', 'values', 'load_data')
+
+
+def _tsv_field(value):
+    """LOAD DATA 기본 형식(탭 구분, \\N = NULL)의 필드 하나"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, str):
+        return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class BulkWriter:
+    """한 테이블에 행 목록을 BULK_STRATEGY로 기록 (커밋은 호출하는 쪽에서)"""
+
+    def __init__(self, table, columns, update_columns=(), strategy=BULK_STRATEGY, batch_rows=VALUES_BATCH_ROWS):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"unknown bulk strategy: {strategy}")
+        if strategy == 'load_data' and update_columns:
+            print(f"[{table}] 'load_data' cannot update only {tuple(update_columns)} on duplicate keys, "
+                  f"using 'executemany'")
+            strategy = 'executemany'
+        self.table = table
+        self.columns = tuple(columns)
+        self.update_columns = tuple(update_columns)
+        self.strategy = strategy
+        self.batch_rows = batch_rows
+        column_list = ', '.join(self.columns)
+        self.placeholders = '(' + ', '.join(['%s'] * len(self.columns)) + ')'
+        self.insert_prefix = f"INSERT INTO {self.table} ({column_list}) VALUES "
+        self.upsert_suffix = (" ON DUPLICATE KEY UPDATE " + ', '.join(f"{c} = VALUES({c})" for c in self.update_columns)
+                              if self.update_columns else '')
+        self.load_data_sql = (f"LOAD DATA LOCAL INFILE %s IGNORE "
+                              f"INTO TABLE {self.table} CHARACTER SET utf8mb4 "
+                              f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({column_list})")
+        self.statements = dict()   # 행 수 -> 'values' 문 (틱마다 같은 행 수라 다시 만들지 않음)
+
+    @property
+    def local_infile(self):
+        """연결에 local_infile=True가 필요한지 (DatabasePool에 넘김)"""
+        return self.strategy == 'load_data'
+
+    def write(self, cursor, rows):
+        """rows를 기록하고 기록한 행 수 반환"""
+        if not rows:
+            return 0
+        if self.strategy == 'load_data':
+            try:
+                return self._load_data(cursor, rows)
+            except (pymysql.err.OperationalError, pymysql.err.InternalError) as e:
+                if e.args[0] not in LOCAL_INFILE_DISABLED:
+                    raise
+                # 데이터를 보내기 전에 거절되므로 같은 트랜잭션에서 다시 기록해도 됨
+                print(f"[{self.table}] LOAD DATA LOCAL INFILE is disabled ({e}), falling back to 'executemany'")
+                self.strategy = 'executemany'
+        if self.strategy == 'values':
+            return self._values(cursor, rows)
+        cursor.executemany(self.insert_prefix + self.placeholders + self.upsert_suffix, rows)
+        return len(rows)
+
+    def _statement(self, count):
+        sql = self.statements.get(count)
+        if sql is None:
+            sql = self.insert_prefix + ', '.join([self.placeholders] * count) + self.upsert_suffix
+            self.statements[count] = sql
+        return sql
+
+    def _values(self, cursor, rows):
+        for start in range(0, len(rows), self.batch_rows):
+            batch = rows[start:start + self.batch_rows]
+            cursor.execute(self._statement(len(batch)), [value for row in batch for value in row])
+        return len(rows)
+
+    def _load_data(self, cursor, rows):
+        data = ''.join('\t'.join(map(_tsv_field, row)) + '\n' for row in rows).encode('utf-8')
+        with tempfile.NamedTemporaryFile(dir=LOAD_DATA_DIR, prefix='bulk_', suffix='.tsv') as file:
+            file.write(data)
+            file.flush()
+            cursor.execute(self.load_data_sql, (file.name,))
+        return len(rows)
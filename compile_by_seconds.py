@@ -13,17 +13,27 @@ Created on Mon Jan  6 23:02:15 2025
 """
 # 모든 키 조회
 
-import os
-import yaml
-import json
-from datetime import datetime, timedelta
+from datetime import datetime
 
+import asyncio
 import redis
+import redis.asyncio
 import requests
-import pymysql
-import pandas as pd
 import time
 
+from db_pool import DatabasePool, load_db_settings
+from bulk_writer import BulkWriter
+from tick_stages import run_stage, run_stages, format_timings
+from tick_scheduler import TickScheduler
+import loop_runner
+
+
+# 틱 하나에서 서로 독립적인 조회는 동시에 실행하고, 마감을 넘긴 값은 NULL로 두고 기록
+TICKER_DEADLINE = 3     # 현재가 REST 조회 마감(초)
+VOLUME_DEADLINE = 2     # Redis 10초 거래량 조회 마감(초)
+TICK_WARN = 5           # 틱 하나가 이보다 오래 걸리면 경고(초)
+FLUSH_DELAY = 1         # upbit_websocket이 봉을 닫고(BUCKET_CLOSE_GRACE + CLOSE_CHECK_INTERVAL) Redis에 기록할 때까지 기다리는 시간(초)
+
 
 def get_krw_markets():
     """업비트 KRW 마켓의 모든 거래쌍 조회"""
@@ -37,16 +47,16 @@ def get_krw_markets():
     return krw_markets
 
 
-def connect_redis():
+async def connect_redis():
     try:
-        r = redis.Redis(
+        r = redis.asyncio.Redis(
             host='localhost', 
             port=6379, 
             db=0, 
             decode_responses=True,
             socket_connect_timeout=5
         )
-        r.ping()  # Redis 서버 연결 테스트
+        await r.ping()  # Redis 서버 연결 테스트
         print("Successfully connected to Redis")
         return r
     except redis.ConnectionError as e:
@@ -61,7 +71,7 @@ def get_current_prices(markets, formatted_time):
     url = "https://api.upbit.com/v1/ticker"
     try:
         # 최적화 포인트 1: 직접 join으로 markets 처리
-        response = requests.get(url, params={"markets": ",".join(markets)})
+        response = requests.get(url, params={"markets": ",".join(markets)}, timeout=TICKER_DEADLINE)
         price_data = response.json()
         
         # 최적화 포인트 2: Dictionary Comprehension 사용
@@ -89,126 +99,90 @@ def get_current_prices(markets, formatted_time):
 #     formatted_time = rounded_time.strftime('%Y-%m-%d %H:%M:%S')
 #     return formatted_time
    
-def get_current_time(current_time):
-    # 현재 시간을 10초 단위로 내림
+def insert_rows(total_list):
+    """tb_market에 한 번에 기록 (스레드에서 실행), 풀에서 연결을 기다린 시간(ms) 반환"""
+    db_started = time.perf_counter()
+    # 오류가 나면 get_connection이 롤백하고 다시 올림
+    with db_pool.get_connection() as connection:
+        wait_ms = (time.perf_counter() - db_started) * 1000
+        with connection.cursor() as cursor:
+            market_writer.write(cursor, total_list)
+        connection.commit()
+    return wait_ms
+
+
+async def fetch_volumes(r, bucket_ms):
+    # 필요한 봉의 키를 시각에서 바로 만들어 조회 (KEYS 스캔 없음)
+    return await r.hgetall(f"trade_volume:{bucket_ms}")
+
+
+async def tick(r, scheduled):
+    """10초 틱 하나: 현재가/거래량을 동시에 조회하고 tb_market에 기록"""
+    started = time.perf_counter()
+    formatted_time = scheduled.formatted_time
+    stages = await run_stages({
+        'ticker': (asyncio.to_thread(get_current_prices, markets, formatted_time), TICKER_DEADLINE),
+        'volume': (fetch_volumes(r, scheduled.bucket_ms), VOLUME_DEADLINE),
+    })
+    # get_current_prices는 실패하면 빈 dict를 돌려주므로 값이 없는 것과 같게 취급
+    price_dic = stages['ticker'].value or None
+    market_volumes = stages['volume'].value
     
-    rounded_seconds = (current_time.second // 10) * 10
-    rounded_time = current_time.replace(second=rounded_seconds, microsecond=0)- timedelta(seconds=10)
-    formatted_time = rounded_time.strftime('%Y-%m-%d %H:%M:%S')
-    return formatted_time
-#%%
-#1. markets데이터 불러옴
-markets = get_krw_markets()
-
-#2. 현재가격 불러오기
-#z = get_current_prices(markets)
-
-
-
-
-r = connect_redis()
-
-while True:
-    try:
-        formatted_time = get_current_time(datetime.now())
-
-        keys = r.keys("trade_volume:*")
-
-        price_dic = get_current_prices(markets,formatted_time)
-
-        # 해시 구조에 맞게 볼륨 추출 로직 수정
-        volume_dic = dict()
-        for key in keys:
-            # 키 구조가 "trade_volume:타임스탬프" 형식
-            _, timestamp_ms = key.split(":")
-            timestamp_ms = int(timestamp_ms)
-            dt = datetime.fromtimestamp(timestamp_ms/1000)
-            new_formatted_time = dt.strftime('%Y-%m-%d %H:%M:%S')
-            
-            if new_formatted_time == formatted_time:
-                # 해당 타임스탬프의 모든 마켓 볼륨 가져오기
-                market_volumes = r.hgetall(key)
-                
-                for market, volume in market_volumes.items():
-                    volume_dic[market] = {formatted_time: volume}
-
-
-
+    total_list = list()
+    for market in markets:
+        # 마감을 넘긴 소스의 값은 NULL, 응답은 왔는데 마켓이 없으면 기존처럼 0
+        if market_volumes is None:
+            volume = None
+        else:
+            try:
+                volume = float(market_volumes[market])
+            except (KeyError, ValueError):
+                volume = 0
+        if price_dic is None:
+            price = None
+        else:
+            try:
+                price = float(price_dic[market][formatted_time])
+            except (KeyError, ValueError, TypeError):
+                price = 0
+        amount = volume * price if volume is not None and price is not None else None
         
-        file_path = "/home/ubuntu/baseball_project/db_settings.yml"  # YAML 파일이 있는 폴더 경로
-        with open(file_path, 'r', encoding = 'utf-8') as file:
-            yaml_data = yaml.safe_load(file)
-            yaml_data = yaml_data['BASEBALL']
-            
-        connection = pymysql.connect(
-        host=yaml_data['HOST'],
-        user=yaml_data['USER'],
-        password=yaml_data['PASSWORD'],
-        db= 'upbit'
-        )
-
+        foreigner_price = 0
+        values = (formatted_time, market, price, volume, amount, foreigner_price)
+        
+        total_list.append(values)
+    
+    insert = await run_stage('insert', asyncio.to_thread(insert_rows, total_list))
+    elapsed = time.perf_counter() - started
+    timings = (f"{format_timings(list(stages.values()) + [insert])}, total {elapsed * 1000:.0f}ms, "
+               f"skew {scheduled.skew * 1000:.0f}ms")
+    if insert.ok:
+        print(f"[{datetime.now()}, {formatted_time}]: Successfully inserted {len(total_list)} records "
+              f"(db connection {insert.value:.1f}ms, {timings})")
+    else:
+        print(f"[{datetime.now()}, {formatted_time}]: Insert failed ({timings})")
+    if elapsed > TICK_WARN:
+        print(f"[{formatted_time}] tick took {elapsed:.1f}s (interval {scheduled.interval}s)")
+
+
+async def main():
+    r = await connect_redis()
+    # 10초 경계 + FLUSH_DELAY마다 직전 봉을 기록 (늦어진 틱은 건너뛰고 missed로 출력, 같은 봉을 두 번 기록하지 않음)
+    scheduler = TickScheduler('compile_by_seconds', offset=FLUSH_DELAY)
+    while True:
+        scheduled = await scheduler.next_tick_async()
         try:
-            with connection.cursor() as cursor:
-                
-                sql = """
-                SELECT * FROM tb_market_info
-                """
-                
-                cursor.execute(sql)
-                market_info_data = pd.DataFrame(cursor.fetchall())
-                
-                cursor.execute("SHOW COLUMNS FROM tb_market_info")
-
-
-                market_info_columns = cursor.fetchall()
-                market_info_columns =  [row[0] for row in market_info_columns]
-
-                market_info_data.columns = market_info_columns
-                
-                
-                
-                total_list = list()
-                for market in markets:
-                    
-                    
-                    try:
-                        volume = float(volume_dic[market][formatted_time])
-                    except:
-                        volume = 0
-                    try:
-                        price = float(price_dic[market][formatted_time])
-                    except:
-                        price = 0
-                    amount = volume * price   
-                    
-                    foreigner_price = 0
-                    values = (formatted_time, market, price, volume, amount, foreigner_price)
-                    
-                    total_list.append(values)
-                
-                
-                sql = """
-                    INSERT INTO tb_market
-                    (log_dt, market, price, volume, amount, price_foreign) 
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    """
-                
-                cursor.executemany(sql, total_list)
-                connection.commit()
-                print(f"[{datetime.now()}, {formatted_time}]: Successfully inserted {len(total_list)} records")
+            await tick(r, scheduled)
         except Exception as e:
-            print(f"Error: {e}")
-            connection.rollback()
-    except Exception as e:
-        print(f"Main loop error: {e}")
+            print(f"Main loop error: {e}")
+
 
-    finally:
-        time.sleep(10)
 #%%
+#1. markets데이터 불러옴
+markets = get_krw_markets()
 
-    
-    
-    
-    
-    
+market_writer = BulkWriter('tb_market', ('log_dt', 'market', 'price', 'volume', 'amount', 'price_foreign'))
+db_pool = DatabasePool(load_db_settings(), db='upbit', pool_size=1, local_infile=market_writer.local_infile)
 
+if __name__ == "__main__":
+    loop_runner.run(main(), name='compile_by_seconds')
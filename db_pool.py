@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+MySQL 연결 풀과 db_settings.yml 설정 캐시 (주기적으로 DB에 기록하는 스크립트 공용)
+
+  - load_db_settings(): db_settings.yml을 프로세스당 한 번만 읽음
+  - DatabasePool: 연결을 만들어 두고 재사용 (주기마다 connect 하지 않음)
+      꺼낼 때 HEALTH_CHECK_IDLE초 이상 쉬었던 연결만 ping으로 확인하고, 끊겼으면 새로 연결
+      사용 중 오류로 롤백도 안 되는 연결은 풀에 돌려놓지 않고 닫음
+"""
+
+import functools
+import time
+from contextlib import contextmanager
+
+import pymysql
+import yaml
+
+
+DB_SETTINGS_PATH = "/home/ubuntu/baseball_project/db_settings.yml"
+HEALTH_CHECK_IDLE = 30   # 이 시간(초) 이상 쉬었던 연결은 꺼낼 때 ping으로 확인
+CONNECT_TIMEOUT = 10     # 연결 시도 제한 시간(초)
+
+
+@functools.lru_cache(maxsize=None)
+def load_db_settings(path=DB_SETTINGS_PATH, section='BASEBALL'):
+    """db_settings.yml의 section 설정 (처음 한 번만 파일을 읽음)"""
+    with open(path, 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file)[section]
+
+
+class DatabasePool:
+    """데이터베이스 연결 풀 관리 클래스"""
+    def __init__(self, yaml_data, db, pool_size=5, cursorclass=pymysql.cursors.Cursor, local_infile=False):
+        self.config = {
+            'host': yaml_data['HOST'],
+            'user': yaml_data['USER'],
+            'password': yaml_data['PASSWORD'],
+            'db': db,
+            'charset': 'utf8mb4',
+            'autocommit': False,
+            'cursorclass': cursorclass,
+            'connect_timeout': CONNECT_TIMEOUT,
+            'local_infile': local_infile,   # BulkWriter의 'load_data'(LOAD DATA LOCAL INFILE)를 쓸 때만 켬
+        }
+        self.pool_size = pool_size
+        self.connections = []   # (연결, 풀에 돌려놓은 시각)
+        self.connects = 0       # 지금까지 새로 연결한 횟수
+        self.connect_seconds = 0.0
+        self._create_pool()
+
+    def _create_pool(self):
+        """연결 풀 생성"""
+        for _ in range(self.pool_size):
+            try:
+                self.connections.append((self._connect(), time.monotonic()))
+            except Exception as e:
+                print(f"Connection pool creation error: {e}")
+
+    def _connect(self):
+        started = time.perf_counter()
+        connection = pymysql.connect(**self.config)
+        self.connects += 1
+        self.connect_seconds += time.perf_counter() - started
+        return connection
+
+    def _checkout(self):
+        try:
+            # pop은 원자적이므로 asyncio.to_thread 등 여러 스레드에서 꺼내도 안전
+            connection, returned_at = self.connections.pop()
+        except IndexError:
+            # 풀이 비어있으면 새로운 연결 생성
+            return self._connect()
+        if time.monotonic() - returned_at >= HEALTH_CHECK_IDLE:
+            try:
+                connection.ping(reconnect=False)
+            except Exception as e:
+                print(f"Stale database connection, reconnecting: {e}")
+                self._close(connection)
+                return self._connect()
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def get_connection(self):
+        """연결 풀에서 연결 가져오기 (with 블록이 끝나면 풀에 반환)"""
+        connection = self._checkout()
+        healthy = True
+        try:
+            yield connection
+        except Exception as e:
+            print(f"Database connection error: {e}")
+            try:
+                connection.rollback()
+            except Exception:
+                healthy = False
+            raise
+        finally:
+            if healthy and len(self.connections) < self.pool_size:
+                self.connections.append((connection, time.monotonic()))
+            else:
+                self._close(connection)
+
+    def close(self):
+        while self.connections:
+            self._close(self.connections.pop()[0])
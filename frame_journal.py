@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+웹소켓 원본 프레임 기록기 (append-only, 고정 크기 세그먼트 파일 + mmap)
+
+수신 루프는 append()로 (수신시각, 프레임)을 메모리 큐에 넣기만 하고,
+실제 파일 쓰기는 백그라운드 스레드가 mmap된 세그먼트에 한다.
+
+세그먼트 파일 : {첫 프레임 수신시각(ns)}.seg, segment_size 크기로 미리 할당
+  레코드 = 헤더(<qI: recv_ns, length) + 프레임 바이트
+  본문을 먼저 쓰고 헤더를 나중에 써서, 길이가 0인 헤더를 만나면 세그먼트 끝으로 본다.
+인덱스 파일   : {같은 이름}.idx, index_interval_ns마다 (recv_ns, offset) 한 쌍(<qQ)
+"""
+
+import bisect
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+
+HEADER = struct.Struct('<qI')
+INDEX_ENTRY = struct.Struct('<qQ')
+
+
+class FrameJournal:
+    """원본 프레임을 세그먼트 파일에 기록 (쓰기는 별도 스레드)"""
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024,
+                 index_interval_ns=1_000_000_000, sync_interval=1.0):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.index_interval_ns = index_interval_ns
+        self.sync_interval = sync_interval
+        self.frames = 0
+        self.bytes = 0
+        self.segments = 0
+        self.oversized = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._mmap = None
+        self._index = None
+        self._offset = 0
+        self._last_indexed_ns = None
+        self._thread = threading.Thread(target=self._run, name="frame-journal", daemon=True)
+        self._thread.start()
+
+    def append(self, frame, recv_ns=None):
+        """프레임을 기록 대기열에 추가 (이벤트 루프를 막지 않음)"""
+        self._queue.put((time.time_ns() if recv_ns is None else recv_ns, frame))
+
+    def close(self):
+        """대기 중인 프레임을 모두 기록하고 종료"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _open_segment(self, recv_ns):
+        path = os.path.join(self.directory, f"{recv_ns:020d}.seg")
+        self._file = open(path, 'w+b')
+        self._file.truncate(self.segment_size)
+        self._mmap = mmap.mmap(self._file.fileno(), self.segment_size)
+        self._index = open(path[:-4] + '.idx', 'ab')
+        self._offset = 0
+        self._last_indexed_ns = None
+        self.segments += 1
+
+    def _seal_segment(self):
+        if self._mmap is None:
+            return
+        self._mmap.flush()
+        self._mmap.close()
+        self._file.close()
+        self._index.close()
+        self._mmap = self._file = self._index = None
+
+    def _write(self, recv_ns, frame):
+        if isinstance(frame, str):
+            # 텍스트 프레임(웹소켓 라이브러리가 str로 넘김)은 UTF-8로 저장
+            frame = frame.encode('utf-8')
+        if not frame:
+            # 길이 0인 헤더는 세그먼트 끝 표시이므로 빈 프레임은 기록하지 않음
+            return
+        size = HEADER.size + len(frame)
+        if size > self.segment_size:
+            self.oversized += 1
+            return
+        if self._mmap is None or self._offset + size + HEADER.size > self.segment_size:
+            # 다음 레코드 자리(빈 헤더)까지 남겨 두고 새 세그먼트로 넘어감
+            self._seal_segment()
+            self._open_segment(recv_ns)
+        if self._last_indexed_ns is None or recv_ns - self._last_indexed_ns >= self.index_interval_ns:
+            self._index.write(INDEX_ENTRY.pack(recv_ns, self._offset))
+            self._last_indexed_ns = recv_ns
+        start = self._offset + HEADER.size
+        self._mmap[start:start + len(frame)] = frame
+        HEADER.pack_into(self._mmap, self._offset, recv_ns, len(frame))
+        self._offset += size
+        self.frames += 1
+        self.bytes += len(frame)
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.sync_interval)
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item:
+                try:
+                    self._write(*item)
+                except Exception as e:
+                    # 레코드 하나의 실패로 스레드가 죽으면 append가 끝없이 쌓이기만 하므로 건너뛰고 계속
+                    self.errors += 1
+                    print(f"Frame journal write error: {e}")
+            now = time.monotonic()
+            if self._mmap is not None and now - last_sync >= self.sync_interval:
+                self._mmap.flush()
+                self._index.flush()
+                last_sync = now
+        self._seal_segment()
+
+
+class JournalReader:
+    """기록된 프레임을 시간순으로 읽기 (인덱스로 시작 시각 탐색)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def segments(self):
+        """(첫 수신시각, 경로) 목록을 시간순으로 반환"""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith('.seg'))
+        return [(int(name[:-4]), os.path.join(self.directory, name)) for name in names]
+
+    def _start_offset(self, path, start_ns):
+        """인덱스에서 start_ns 이전의 가장 가까운 레코드 위치를 찾음"""
+        try:
+            with open(path[:-4] + '.idx', 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return 0
+        count = len(data) // INDEX_ENTRY.size
+        entries = [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size) for i in range(count)]
+        position = bisect.bisect_right([recv_ns for recv_ns, _ in entries], start_ns) - 1
+        return entries[position][1] if position >= 0 else 0
+
+    def read(self, start_ns=None, end_ns=None):
+        """[start_ns, end_ns) 구간의 (recv_ns, frame)을 순서대로 생성"""
+        segments = self.segments()
+        if start_ns is not None:
+            # start_ns가 속한 세그먼트부터 읽음
+            first = bisect.bisect_right([ts for ts, _ in segments], start_ns) - 1
+            segments = segments[max(first, 0):]
+        for first_ns, path in segments:
+            if end_ns is not None and first_ns >= end_ns:
+                return
+            with open(path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    offset = self._start_offset(path, start_ns) if start_ns is not None else 0
+                    while offset + HEADER.size <= len(mm):
+                        recv_ns, length = HEADER.unpack_from(mm, offset)
+                        if length == 0:
+                            break
+                        if end_ns is not None and recv_ns >= end_ns:
+                            return
+                        if start_ns is None or recv_ns >= start_ns:
+                            yield recv_ns, mm[offset + HEADER.size:offset + HEADER.size + length]
+                        offset += HEADER.size + length
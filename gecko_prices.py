@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+CoinGecko 해외 가격(simple/price) 백그라운드 갱신기
+
+10초 봉 기록 루프가 매 주기 CoinGecko를 직접 호출하지 않도록, 별도 스레드가
+GECKO_REFRESH_INTERVAL마다 가격을 받아 (가격, 받은 시각) 캐시에 넣고 기록 루프는 캐시만 읽는다.
+  - id 목록은 URL 길이(GECKO_MAX_IDS_LENGTH)에 맞춰 나눠서 요청
+  - 429(요청 한도 초과)를 받으면 Retry-After(없으면 지수 백오프)만큼 쉬고 다음 주기에 다시 시도
+  - GECKO_MAX_AGE보다 오래된 가격은 없는 것(None)으로 취급
+"""
+
+import threading
+import time
+
+import requests
+
+
+GECKO_URL = "https://api.coingecko.com/api/v3/simple/price"
+GECKO_REFRESH_INTERVAL = 60   # 전체 가격 갱신 주기(초), 무료 한도(분당 수십 회) 안에서 조절
+GECKO_MAX_IDS_LENGTH = 1500   # 요청 하나의 ids 파라미터 최대 길이(문자), URL 길이 제한 대비
+GECKO_MAX_AGE = 600           # 이보다 오래된 가격은 쓰지 않음(초)
+GECKO_BACKOFF_BASE = 60       # 429를 받았을 때 Retry-After가 없으면 쉬는 시간(초), 연속이면 2배
+GECKO_BACKOFF_MAX = 900       # 백오프 상한(초)
+GECKO_EMPTY_RETRY = 5         # id 목록이 아직 비어 있을 때 다시 확인하는 주기(초)
+
+
+def chunk_ids(ids, max_length=GECKO_MAX_IDS_LENGTH):
+    """쉼표로 이은 길이가 max_length를 넘지 않도록 id 목록을 나눔"""
+    chunks, chunk, length = [], [], 0
+    for gecko_id in ids:
+        added = len(gecko_id) + (1 if chunk else 0)
+        if chunk and length + added > max_length:
+            chunks.append(chunk)
+            chunk, length = [], 0
+            added = len(gecko_id)
+        chunk.append(gecko_id)
+        length += added
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class GeckoPriceRefresher:
+    """CoinGecko KRW 가격 캐시 (gecko_id -> (가격, 받은 시각)), 백그라운드 스레드가 갱신"""
+
+    def __init__(self, get_ids, vs_currency='krw', interval=GECKO_REFRESH_INTERVAL):
+        self.get_ids = get_ids          # 호출할 때마다 현재 gecko_id 목록을 반환하는 함수
+        self.vs_currency = vs_currency
+        self.interval = interval
+        self.prices = dict()
+        self.session = requests.Session()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.backoff = 0
+        self.last_refresh = None        # 마지막으로 전체 갱신을 마친 시각
+        self.rate_limited = 0           # 429를 받은 횟수
+
+    def price(self, gecko_id, max_age=GECKO_MAX_AGE):
+        """캐시의 가격 (없거나 max_age보다 오래됐으면 None), 네트워크를 기다리지 않음"""
+        cached = self.prices.get(gecko_id)
+        if cached is None or time.time() - cached[1] > max_age:
+            return None
+        return cached[0]
+
+    def _fetch(self, ids):
+        response = self.session.get(GECKO_URL, params={'ids': ','.join(ids), 'vs_currencies': self.vs_currency},
+                                    timeout=10)
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            raise RateLimited(int(retry_after) if retry_after and retry_after.isdigit() else None)
+        response.raise_for_status()
+        return response.json()
+
+    def refresh(self):
+        """모든 id를 나눠서 한 번 갱신 (429를 받으면 RateLimited, 그 전까지 받은 가격은 반영됨)"""
+        ids = self.get_ids()
+        if not ids:
+            return False
+        for chunk in chunk_ids(ids):
+            data = self._fetch(chunk)
+            fetched_at = time.time()
+            for gecko_id, prices in data.items():
+                price = prices.get(self.vs_currency)
+                if price is not None:
+                    # dict 항목 하나를 통째로 바꾸므로 읽는 쪽은 잠금 없이 읽음
+                    self.prices[gecko_id] = (price, fetched_at)
+        self.last_refresh = time.time()
+        return True
+
+    def run(self):
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                wait = self.interval if self.refresh() else GECKO_EMPTY_RETRY
+                self.backoff = 0
+            except RateLimited as e:
+                self.rate_limited += 1
+                self.backoff = min(GECKO_BACKOFF_MAX, self.backoff * 2 if self.backoff else GECKO_BACKOFF_BASE)
+                wait = e.retry_after if e.retry_after is not None else self.backoff
+                print(f"CoinGecko rate limited, retrying in {wait}s")
+            except Exception as e:
+                print(f"CoinGecko refresh failed: {e}")
+                wait = self.interval
+            self.stop_event.wait(max(0, wait - (time.monotonic() - started)))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='gecko-prices', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
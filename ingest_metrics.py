@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+수집 파이프라인 단계별 지연 히스토그램과 Prometheus 형식 /metrics 엔드포인트
+
+단계 (마이크로초로 기록하고 초 단위로 노출)
+  - exchange_to_receive : 거래소 체결 시각(tms) -> 웹소켓 수신
+  - receive_to_dequeue  : 수신 -> 처리 워커가 큐에서 꺼냄
+  - dequeue_to_commit   : 큐에서 꺼냄 -> 그 체결이 든 1초봉이 Redis에 기록 완료
+
+히스토그램은 HDR 방식(2의 거듭제곱 구간마다 같은 개수의 선형 하위 구간)이라
+값의 크기와 상관없이 상대 오차가 일정하고(하위 구간 32개면 약 3%), 기록은 정수 연산 몇 번이다.
+Prometheus에는 summary(분위수, _sum, _count)로 노출한다.
+"""
+
+import asyncio
+
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class LatencyHistogram:
+    """HDR 방식 지연 히스토그램 (정수 마이크로초)"""
+
+    def __init__(self, sub_buckets=32, max_value=3_600_000_000):
+        self.sub_buckets = sub_buckets
+        self.sub_bits = sub_buckets.bit_length() - 1
+        self.max_value = max_value
+        self.counts = [0] * ((max_value.bit_length() + 1) * sub_buckets)
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def _index(self, value):
+        if value < self.sub_buckets:
+            return value
+        exponent = value.bit_length() - self.sub_bits - 1
+        return (exponent + 1) * self.sub_buckets + (value >> exponent) - self.sub_buckets
+
+    def _highest_value(self, index):
+        """index 구간에 들어가는 가장 큰 값"""
+        if index < self.sub_buckets:
+            return index
+        exponent = index // self.sub_buckets - 1
+        return ((index % self.sub_buckets + self.sub_buckets + 1) << exponent) - 1
+
+    def record(self, value, count=1):
+        value = min(max(int(value), 0), self.max_value)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self.sum += value * count
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """pct(0~100) 분위수, 기록이 없으면 0"""
+        if self.total == 0:
+            return 0
+        target = max(1, -(-self.total * pct // 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._highest_value(index), self.max)
+        return self.max
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+def _label_text(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in items) + '}'
+
+
+class MetricsRegistry:
+    """프로세스 하나의 메트릭 모음 (histogram / counter / gauge)"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """fork한 자식 프로세스에서 부모의 메트릭을 버릴 때 사용"""
+        self.metrics = dict()  # name -> (type, help, {labels: histogram/counter/함수})
+
+    def _register(self, kind, name, help_text, labels, factory):
+        _, _, series = self.metrics.setdefault(name, (kind, help_text, dict()))
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = factory()
+        return series[key]
+
+    def histogram(self, name, help_text, **labels):
+        return self._register('summary', name, help_text, labels, LatencyHistogram)
+
+    def counter(self, name, help_text, **labels):
+        return self._register('counter', name, help_text, labels, Counter)
+
+    def gauge(self, name, help_text, read, kind='gauge', **labels):
+        """read()를 노출 시점에 호출해 값을 읽음 (큐 길이, 다른 곳에 있는 카운터 등)"""
+        _, _, series = self.metrics.setdefault(name, (kind, help_text, dict()))
+        series[tuple(sorted(labels.items()))] = read
+
+    def render(self):
+        """Prometheus text format (0.0.4)"""
+        lines = []
+        for name, (kind, help_text, series) in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in series.items():
+                if isinstance(metric, LatencyHistogram):
+                    for quantile in QUANTILES:
+                        value = metric.percentile(quantile * 100) / 1e6
+                        lines.append(f"{name}{_label_text(labels, quantile=quantile)} {value}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {metric.sum / 1e6}")
+                    lines.append(f"{name}_count{_label_text(labels)} {metric.total}")
+                elif isinstance(metric, Counter):
+                    lines.append(f"{name}{_label_text(labels)} {metric.value}")
+                else:
+                    lines.append(f"{name}{_label_text(labels)} {metric()}")
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = MetricsRegistry()
+
+
+class CommitLatency:
+    """큐에서 꺼낸 체결이 든 봉이 Redis에 기록될 때까지의 지연 (dequeue_to_commit)"""
+
+    def __init__(self, histogram, interval_ms=1000):
+        self.histogram = histogram
+        self.interval_ms = interval_ms
+        self.pending = dict()  # 봉 시작 ts -> {꺼낸 시각(ns): 체결 수}
+
+    def dequeued(self, tms, now_ns, count=1):
+        times = self.pending.setdefault(tms - tms % self.interval_ms, dict())
+        times[now_ns] = times.get(now_ns, 0) + count
+
+    def committed(self, closed_until, now_ns):
+        """closed_until(ms) 이전에 시작한 봉이 모두 기록된 시점에 호출"""
+        if closed_until is None:
+            return
+        for base_timestamp in [ts for ts in self.pending if ts < closed_until]:
+            for dequeued_ns, count in self.pending.pop(base_timestamp).items():
+                self.histogram.record((now_ns - dequeued_ns) // 1000, count)
+
+
+async def serve_metrics(port, host='127.0.0.1', registry=METRICS):
+    """GET /metrics 에 Prometheus 형식으로 응답하는 최소 HTTP 서버"""
+    async def handle(reader, writer):
+        try:
+            request = await reader.readline()
+            # 나머지 요청 헤더는 읽고 버림
+            while await reader.readline() not in (b'\r\n', b'\n', b''):
+                pass
+            if request.split()[1:2] == [b'/metrics']:
+                status, body = '200 OK', registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except Exception as e:
+            print(f"Metrics request error: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+웹소켓 수신부와 처리부 사이의 큐 (백프레셔 정책 선택 가능)
+
+큐가 가득 찼을 때 조용히 버리지 않고, 정책에 따라 처리한 뒤 카운터로 남긴다.
+  - drop_oldest : 고정 크기 링 버퍼, 가장 오래된 메시지를 버림 (dropped)
+  - coalesce    : 큐에 있는 동안 같은 (마켓, 버킷)의 체결을 하나로 합침 (coalesced)
+  - spill       : 메모리가 가득 차면 디스크에 기록했다가, 처리부가 따라잡으면 다시 읽음 (spilled/replayed)
+
+asyncio.Queue와 같은 방식(get/get_nowait/qsize/full/task_done)으로 사용하되,
+put_nowait는 절대 막히거나 예외를 내지 않는다.
+"""
+
+import asyncio
+import os
+from collections import deque, OrderedDict
+
+import orjson
+
+from trade_aggregator import TradeBucket
+from ws_decoder import Trade
+
+
+class IngestQueue:
+    """백프레셔 정책 큐의 공통 부분"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.stats = {'put': 0, 'dropped': 0, 'coalesced': 0, 'spilled': 0, 'replayed': 0}
+        self._not_empty = asyncio.Event()
+
+    def qsize(self):
+        raise NotImplementedError
+
+    def full(self):
+        return self.qsize() >= self.maxsize
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def put_nowait(self, item):
+        self.stats['put'] += 1
+        self._put(item)
+        self._not_empty.set()
+
+    def get_nowait(self):
+        if self.qsize() == 0:
+            raise asyncio.QueueEmpty
+        return self._get()
+
+    async def get(self):
+        while self.qsize() == 0:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        return self._get()
+
+    def task_done(self):
+        pass
+
+    def stats_text(self):
+        return ", ".join(f"{name}={count}" for name, count in self.stats.items())
+
+
+class DropOldestQueue(IngestQueue):
+    """가득 차면 가장 오래된 메시지를 버리는 링 버퍼"""
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self._items = deque()
+
+    def qsize(self):
+        return len(self._items)
+
+    def _put(self, item):
+        if len(self._items) >= self.maxsize:
+            self._items.popleft()
+            self.stats['dropped'] += 1
+        self._items.append(item)
+
+    def _get(self):
+        return self._items.popleft()
+
+
+class CoalescingQueue(IngestQueue):
+    """
+    큐에 있는 동안 같은 (마켓, 버킷)의 체결을 TradeBucket 하나로 합침
+
+    interval_ms는 가장 짧은 봉 주기에 맞춰야 모든 주기의 OHLCV가 그대로 유지된다.
+    꺼내는 항목은 Trade가 아니라 부분 집계(TradeBucket)이다.
+    """
+
+    def __init__(self, maxsize, interval_ms=1000):
+        super().__init__(maxsize)
+        self.interval_ms = interval_ms
+        self._items = OrderedDict()  # (market, base_timestamp) -> TradeBucket
+
+    def qsize(self):
+        return len(self._items)
+
+    def _put(self, trade):
+        key = (trade.cd, trade.tms - (trade.tms % self.interval_ms))
+        bucket = self._items.get(key)
+        if bucket is None:
+            if len(self._items) >= self.maxsize:
+                _, oldest = self._items.popitem(last=False)
+                self.stats['dropped'] += oldest.count
+            bucket = self._items[key] = TradeBucket(*key)
+            bucket.rts = trade.rts
+        else:
+            self.stats['coalesced'] += 1
+        bucket.add(trade.tp, trade.tv, trade.ab, trade.tms)
+
+    def _get(self):
+        return self._items.popitem(last=False)[1]
+
+
+class SpillQueue(IngestQueue):
+    """
+    메모리 큐가 가득 차면 디스크 파일에 이어 쓰고, 처리부가 따라잡으면 순서대로 다시 읽음
+
+    디스크에 남은 메시지가 있는 동안에는 순서 유지를 위해 새 메시지도 디스크로 보낸다.
+    """
+
+    def __init__(self, maxsize, spill_path, replay_chunk=1000):
+        super().__init__(maxsize)
+        self.spill_path = spill_path
+        self.replay_chunk = replay_chunk
+        self.low_watermark = maxsize // 2
+        self._items = deque()
+        self._spilled = 0  # 디스크에 남아 있는 메시지 수
+        os.makedirs(os.path.dirname(spill_path) or '.', exist_ok=True)
+        self._writer = open(spill_path, 'wb')
+        self._reader = open(spill_path, 'rb')
+
+    def qsize(self):
+        return len(self._items) + self._spilled
+
+    def full(self):
+        return len(self._items) >= self.maxsize
+
+    def _put(self, item):
+        if self._spilled == 0 and len(self._items) < self.maxsize:
+            self._items.append(item)
+            return
+        self._writer.write(orjson.dumps(item.to_tuple()) + b'\n')
+        self._spilled += 1
+        self.stats['spilled'] += 1
+
+    def _replay(self):
+        """디스크에 쌓인 메시지를 메모리 큐로 옮김"""
+        self._writer.flush()
+        for _ in range(min(self.replay_chunk, self._spilled)):
+            self._items.append(Trade(*orjson.loads(self._reader.readline())))
+            self._spilled -= 1
+            self.stats['replayed'] += 1
+        if self._spilled == 0:
+            # 모두 다시 읽었으면 파일을 비움
+            self._writer.seek(0)
+            self._writer.truncate()
+            self._reader.seek(0)
+
+    def _get(self):
+        if self._spilled and len(self._items) <= self.low_watermark:
+            self._replay()
+        return self._items.popleft()
+
+
+QUEUE_POLICIES = ('drop_oldest', 'coalesce', 'spill')
+
+
+def make_ingest_queue(policy, maxsize, spill_path=None, interval_ms=1000):
+    """정책 이름으로 수신 큐 생성"""
+    if policy == 'drop_oldest':
+        return DropOldestQueue(maxsize)
+    if policy == 'coalesce':
+        return CoalescingQueue(maxsize, interval_ms=interval_ms)
+    if policy == 'spill':
+        if spill_path is None:
+            raise ValueError("spill policy requires spill_path")
+        return SpillQueue(maxsize, spill_path)
+    raise ValueError(f"Unknown queue policy: {policy} (choose from {QUEUE_POLICIES})")
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio 진입점 공용 실행기와 이벤트 루프 지연(loop lag) 측정기
+
+  - run(main): uvloop이 설치되어 있으면 uvloop, 없으면 기본 asyncio 루프로 main 코루틴을 실행
+    (LOOP_IMPL로 강제 가능). 데몬은 nest_asyncio 패치 없이 자기 루프 하나만 쓰고,
+    Spyder/Jupyter처럼 이미 루프가 돌고 있는 대화형 환경에서만 nest_asyncio를 적용한다.
+  - LoopLagMonitor: LAG_SAMPLE_INTERVAL마다 깨어나 예정 시각보다 늦게 깨어난 시간을 기록.
+    코루틴 안의 동기 호출(requests, pymysql, 무거운 pandas 연산 등)이 루프를 막으면 이 값이 커진다.
+    ingest_metrics의 event_loop_lag_seconds 히스토그램으로 노출되고, LAG_WARN_THRESHOLD를 넘으면 출력한다.
+"""
+
+import asyncio
+
+from ingest_metrics import METRICS
+
+
+LOOP_IMPL = 'auto'           # 'auto': uvloop이 있으면 사용 / 'uvloop' / 'asyncio'
+LAG_SAMPLE_INTERVAL = 0.1    # 루프 지연 측정 주기(초)
+LAG_WARN_THRESHOLD = 0.1     # 이보다 오래 루프가 막히면 출력(초)
+LAG_REPORT_INTERVAL = 60     # 루프 지연 요약 출력 주기(초), None이면 출력하지 않음
+
+
+def loop_factory(loop_impl=LOOP_IMPL):
+    """LOOP_IMPL에 맞는 이벤트 루프 생성 함수와 이름"""
+    if loop_impl in ('auto', 'uvloop'):
+        try:
+            import uvloop
+            return uvloop.new_event_loop, 'uvloop'
+        except ImportError:
+            if loop_impl == 'uvloop':
+                raise
+    return asyncio.new_event_loop, 'asyncio'
+
+
+class LoopLagMonitor:
+    """이벤트 루프 스케줄링 지연 측정 (예정 시각 대비 늦게 깨어난 시간)"""
+
+    def __init__(self, name='main', interval=LAG_SAMPLE_INTERVAL, warn_threshold=LAG_WARN_THRESHOLD,
+                 report_interval=LAG_REPORT_INTERVAL, registry=METRICS):
+        self.name = name
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self.report_interval = report_interval
+        self.histogram = registry.histogram('event_loop_lag_seconds',
+                                            "Event loop scheduling delay", loop=name)
+        self.task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        report_start = loop.time()
+        report_max = 0.0
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            lag = max(now - expected, 0.0)
+            self.histogram.record(lag * 1e6)
+            report_max = max(report_max, lag)
+            if lag >= self.warn_threshold:
+                print(f"[{self.name}] Event loop blocked for {lag * 1000:.0f}ms")
+            if self.report_interval and now - report_start >= self.report_interval:
+                print(f"[{self.name}] loop lag p50={self.histogram.percentile(50) / 1000:.1f}ms "
+                      f"p99={self.histogram.percentile(99) / 1000:.1f}ms max={report_max * 1000:.1f}ms")
+                report_start = now
+                report_max = 0.0
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+async def _run_monitored(main, name, monitor_lag):
+    monitor = LoopLagMonitor(name) if monitor_lag else None
+    if monitor is not None:
+        monitor.start()
+    try:
+        return await main
+    finally:
+        if monitor is not None:
+            monitor.stop()
+
+
+def _loop_is_running():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def run(main, name='main', loop_impl=LOOP_IMPL, monitor_lag=True):
+    """asyncio.run 대신 쓰는 공용 실행기 (루프 구현 선택 + 루프 지연 측정)"""
+    coro = _run_monitored(main, name, monitor_lag)
+    if _loop_is_running():
+        # 대화형 환경(Spyder/Jupyter)에서 셀로 실행할 때만 중첩 루프 허용
+        import nest_asyncio
+        nest_asyncio.apply()
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    factory, impl = loop_factory(loop_impl)
+    print(f"[{name}] event loop: {impl}")
+    with asyncio.Runner(loop_factory=factory) as runner:
+        return runner.run(coro)
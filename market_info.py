@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+tb_market_info 메타데이터 캐시 (market -> gecko_id/symbol/korean_name/english_name ...)
+
+매 주기 SELECT * / SHOW COLUMNS 후 DataFrame을 마켓마다 필터링하던 것(O(마켓 수^2))을
+dict 조회(O(1))로 바꾼다. TTL마다 CHECKSUM TABLE로 테이블이 바뀌었는지만 확인하고,
+바뀌었을 때만 전체를 다시 읽는다.
+"""
+
+import time
+
+
+MARKET_INFO_TTL = 300   # 테이블 변경 여부 확인 주기(초)
+
+
+class MarketInfoCache:
+    """tb_market_info 캐시 (market -> 행 dict)"""
+
+    def __init__(self, table='tb_market_info', ttl=MARKET_INFO_TTL):
+        self.table = table
+        self.ttl = ttl
+        self.rows = dict()
+        self.checksum = None
+        self.checked_at = None
+
+    def refresh(self, connection, force=False):
+        """TTL이 지났으면 체크섬을 확인하고, 바뀌었을 때만 다시 읽음 (다시 읽었으면 True)"""
+        now = time.monotonic()
+        if not force and self.checked_at is not None and now - self.checked_at < self.ttl:
+            return False
+        # 실패해도 이전 캐시를 그대로 쓰고 다음 TTL에 다시 시도
+        self.checked_at = now
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"CHECKSUM TABLE {self.table}")
+                result = cursor.fetchone()
+                checksum = result['Checksum'] if isinstance(result, dict) else result[1]
+                if not force and self.rows and checksum == self.checksum:
+                    return False
+                cursor.execute(f"SELECT * FROM {self.table}")
+                columns = [column[0] for column in cursor.description]
+                rows = [row if isinstance(row, dict) else dict(zip(columns, row)) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"Market info refresh failed: {e}")
+            return False
+        self.rows = {row['market']: row for row in rows}
+        self.checksum = checksum
+        print(f"Market info loaded: {len(self.rows)} markets")
+        return True
+
+    def get(self, market, column, default=None):
+        row = self.rows.get(market)
+        if row is None:
+            return default
+        return row.get(column, default)
+
+    def gecko_id(self, market):
+        return self.get(market, 'gecko_id')
+
+    def gecko_ids(self):
+        """gecko_id가 있는 마켓들의 gecko_id 목록 (중복 제거, 순서 유지)"""
+        return list(dict.fromkeys(row['gecko_id'] for row in self.rows.values() if row.get('gecko_id')))
@@ -9,6 +9,8 @@ export LANG=en_US.UTF-8
 # 가격 데이터 수집 스크립트 실행
 #/usr/bin/python3 /home/ubuntu/upbit_project/upbit_by_seconds.py &
 
+# 빗썸 가격 수집: bithumb_by_seconds는 bithumb_websocket이 Redis에 기록한 10초 봉(bithumb:trade_stats:*)을 읽으므로 함께 실행
+#/usr/bin/python3 /home/ubuntu/upbit_project/bithumb/bithumb_websocket.py &
 #/usr/bin/python3 /home/ubuntu/upbit_project/bithumb/bithumb_by_seconds.py &
 /usr/bin/python3 /home/ubuntu/upbit_project/bitget/bitget_by_seconds.py &
 wait
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+BulkWriter 기록 방식별 벤치마크 (로컬 MySQL/MariaDB 필요)
+
+10초 수집기가 한 틱에 기록하는 것과 같은 모양의 행(log_dt, market, price, volume, amount, price_foreign)을
+틱마다 새 log_dt로 --ticks번 기록하고, 전략별로 틱 하나에 더해지는 지연(기록 + 커밋)과 초당 행 수를 출력한다.
+  - executemany: cursor.executemany (기본값)
+  - values     : 여러 행 INSERT ... VALUES
+  - load_data  : LOAD DATA LOCAL INFILE (서버에 local_infile=ON 필요, 꺼져 있으면 executemany로 바뀐 결과가 나옴)
+--upsert를 주면 bithumb/bitget처럼 ON DUPLICATE KEY UPDATE price로 같은 log_dt를 다시 기록한다
+(load_data는 열 단위 갱신을 못 하므로 executemany로 바뀐 결과가 나옴).
+
+예) python test/benchmark_bulk_writer.py --user root --password secret --db bench
+    python test/benchmark_bulk_writer.py --rows 300 1000 5000 --ticks 50 --upsert
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pymysql
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bulk_writer import STRATEGIES, BulkWriter
+
+
+TABLE = 'bench_tb_market'
+COLUMNS = ('log_dt', 'market', 'price', 'volume', 'amount', 'price_foreign')
+
+
+def make_rows(log_dt, count):
+    return [(log_dt, f"KRW-M{i:04d}", 1000.0 + i * 0.5, 12.345 + i, (1000.0 + i * 0.5) * (12.345 + i),
+             None if i % 5 else 999.5 + i) for i in range(count)]
+
+
+def create_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cursor.execute(f"""
+            CREATE TABLE {TABLE} (
+                log_dt DATETIME NOT NULL,
+                market VARCHAR(20) NOT NULL,
+                price DOUBLE, volume DOUBLE, amount DOUBLE, price_foreign DOUBLE,
+                PRIMARY KEY (log_dt, market)
+            ) ENGINE=InnoDB""")
+    connection.commit()
+
+
+def measure(connection, strategy, rows, ticks, upsert):
+    writer = BulkWriter(TABLE, COLUMNS, update_columns=('price',) if upsert else (), strategy=strategy)
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE TABLE {TABLE}")
+    start = datetime(2025, 1, 1)
+    latencies = []
+    for tick in range(ticks):
+        # upsert면 같은 log_dt를 두 번씩 기록해 절반은 중복 키 갱신이 되도록 함
+        log_dt = (start + timedelta(seconds=10 * (tick // 2 if upsert else tick))).strftime('%Y-%m-%d %H:%M:%S')
+        batch = make_rows(log_dt, rows)
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            writer.write(cursor, batch)
+        connection.commit()
+        latencies.append(time.perf_counter() - started)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLE}")
+        stored = cursor.fetchone()[0]
+    median = statistics.median(latencies)
+    p95 = sorted(latencies)[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    label = strategy if writer.strategy == strategy else f"{strategy}->{writer.strategy}"
+    print(f"  {label:<22} median {median * 1000:7.2f}ms  p95 {p95 * 1000:7.2f}ms  "
+          f"max {max(latencies) * 1000:7.2f}ms  {rows / median:10.0f} rows/s  ({stored} rows stored)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="bulk write strategy benchmark")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--db', default='bench')
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES))
+    parser.add_argument('--rows', nargs='+', type=int, default=[300, 1000, 3000], help="틱 하나의 행 수")
+    parser.add_argument('--ticks', type=int, default=30)
+    parser.add_argument('--upsert', action='store_true', help="ON DUPLICATE KEY UPDATE price로 기록")
+    args = parser.parse_args(argv)
+
+    connection = pymysql.connect(host=args.host, port=args.port, user=args.user, password=args.password,
+                                 db=args.db, charset='utf8mb4', autocommit=False, local_infile=True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT VERSION(), @@local_infile")
+            version, local_infile = cursor.fetchone()
+        print(f"server {version}, local_infile={local_infile}, {args.ticks} ticks per run"
+              + (", upsert" if args.upsert else ""))
+        create_table(connection)
+        for rows in args.rows:
+            print(f"{rows} rows/tick")
+            for strategy in args.strategies:
+                measure(connection, strategy, rows, args.ticks, args.upsert)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+SIMPLE 포맷 체결 프레임 디코딩 벤치마크: 기존 dict 경로 vs ws_decoder 타입 경로
+
+  - dict  : orjson.loads(frame.decode('utf8')) 후 data['tms'], data['cd'], float(data['tv']) ... 조회
+  - typed : ws_decoder.decode_trade(frame) 후 trade.tms, trade.cd, trade.tv ... 조회
+두 경로 모두 처리부가 실제로 읽는 필드(cd, tms, tp, tv, ab, sid)를 버킷 계산까지 사용한다.
+
+예) python test/benchmark_decode.py --messages 200000
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+import tracemalloc
+
+from orjson import loads as orjson_loads
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from replay_server import synthetic_markets, synthetic_trades, stamp
+from ws_decoder import decode_trade, msgspec
+
+
+TEN_SECONDS = 10000
+PRODUCTION_RATES = [1000, 5000, 20000]  # 평상시 / 변동성 구간 / 급등락 구간 초당 메시지 수
+
+
+def dict_path(frames):
+    total = 0.0
+    for frame in frames:
+        data = orjson_loads(frame.decode('utf8'))
+        base_timestamp = data['tms'] - (data['tms'] % TEN_SECONDS)
+        key = (data['cd'], base_timestamp, data['ab'], data.get('sid'))
+        total += float(data['tp']) * float(data['tv'])
+    return total, key
+
+
+def typed_path(frames):
+    total = 0.0
+    for frame in frames:
+        trade = decode_trade(frame)
+        base_timestamp = trade.tms - (trade.tms % TEN_SECONDS)
+        key = (trade.cd, base_timestamp, trade.ab, trade.sid)
+        total += trade.tp * trade.tv
+    return total, key
+
+
+def measure(name, func, frames, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(frames)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    per_message_us = best / len(frames) * 1e6
+    print(f"{name:<6} {len(frames) / best:>12,.0f} msgs/s  {per_message_us:>7.2f} us/msg  "
+          + "  ".join(f"@{rate}/s: {rate * per_message_us / 1e4:.1f}% core" for rate in PRODUCTION_RATES))
+
+
+def retained_bytes(func, frames):
+    """디코딩 결과 객체를 유지할 때의 메시지당 메모리(큐에 쌓인 상태를 가정)"""
+    tracemalloc.start()
+    kept = [func(frame) for frame in frames]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current / len(frames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SIMPLE trade frame decode benchmark")
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    frames = [stamp(trade) for trade in itertools.islice(synthetic_trades(synthetic_markets()), args.messages)]
+    print(f"{args.messages} frames, avg {sum(map(len, frames)) / len(frames):.0f} bytes, "
+          f"typed backend: {'msgspec' if msgspec is not None else 'orjson'}")
+    measure('dict', dict_path, frames, args.repeat)
+    measure('typed', typed_path, frames, args.repeat)
+
+    sample = frames[:20000]
+    print(f"retained memory: dict {retained_bytes(lambda f: orjson_loads(f.decode('utf8')), sample):.0f} B/msg, "
+          f"typed {retained_bytes(decode_trade, sample):.0f} B/msg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+수신 경로(upbit_ws_client) 처리량/지연 벤치마크 (로컬 리플레이 서버 사용)
+
+replay_server를 별도 프로세스로 띄우고, 큐 정책별로 upbit_ws_client를 붙여
+초당 메시지 수를 단계적으로 올리며 측정한다.
+  - 지연(end-to-end): 서버 송신 시각(bts) -> 캔들 엔진에 반영된 시각
+    (coalesce 정책에서 합쳐진 항목은 마지막 체결의 tms 기준, ms 단위)
+  - 유지 가능한 최대 처리량: 버림/디스크 기록 없이 받은 양의 99% 이상을 처리하고 p99 < 1초인 최대 rate
+    (서버가 목표 rate의 95%도 보내지 못한 단계는 서버 한계로 보고 제외)
+Redis는 기본적으로 기록을 버리는 NullRedis를 쓰고, --redis를 주면 localhost Redis에 기록한다.
+
+예) python test/benchmark_ingest.py --rates 1000 5000 10000 --duration 10
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+import orjson
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import replay_server
+import upbit_websocket as ws
+from ingest_queue import QUEUE_POLICIES
+from trade_aggregator import CandleEngine
+from ws_decoder import decode_trade
+
+
+DRAIN_SECONDS = 2  # 전송이 끝난 뒤 남은 큐를 처리할 시간
+
+
+def make_bench_decoder(sent_ns, received):
+    """리플레이 서버의 송신 시각(bts)을 sid별로 따로 보관하고 수신 개수를 세는 디코더"""
+    def decode_bench_trade(frame):
+        trade = decode_trade(frame)
+        sent_ns[trade.sid] = orjson.loads(frame)['bts']
+        received[0] += 1
+        return trade
+    return decode_bench_trade
+
+
+class NullPipeline:
+    def hset(self, *args, **kwargs):
+        pass
+
+    def expire(self, *args, **kwargs):
+        pass
+
+    def xadd(self, *args, **kwargs):
+        pass
+
+    def execute(self):
+        return []
+
+
+class NullRedis:
+    """Redis 없이 수신/집계 경로만 측정하기 위한 가짜 클라이언트"""
+    def pipeline(self, transaction=True):
+        return NullPipeline()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_server(port, rate, duration, markets):
+    args = replay_server.parse_args(['--port', str(port), '--rate', str(rate),
+                                     '--duration', str(duration), '--markets', str(markets)])
+    asyncio.run(replay_server.serve(args))
+
+
+def run_client(port, policy, duration, markets, use_redis, workers, results):
+    """한 가지 큐 정책으로 upbit_ws_client를 실행하고 결과를 results에 넣음"""
+    latencies = []
+    processed = [0]
+    received = [0]
+    sent_ns = dict()
+    queues = []
+
+    class MeasuredEngine(CandleEngine):
+        def add(self, trade):
+            super().add(trade)
+            latencies.append(time.time_ns() - sent_ns.pop(trade.sid))
+            processed[0] += 1
+
+        def merge(self, partial):
+            super().merge(partial)
+            latencies.append(time.time_ns() - partial.last_tms * 1_000_000)
+            sent_ns.clear()
+            processed[0] += partial.count
+
+    def make_queue(*args, **kwargs):
+        queue = make_ingest_queue(*args, **kwargs)
+        queues.append(queue)
+        return queue
+
+    make_ingest_queue = ws.make_ingest_queue
+    ws.make_ingest_queue = make_queue
+    ws.CandleEngine = MeasuredEngine
+    ws.decode_trade = make_bench_decoder(sent_ns, received)
+    ws.QUEUE_POLICY = policy
+    ws.CONSUMER_WORKERS = workers
+    ws.BACKFILL_ON_RECONNECT = False
+    ws.STATS_INTERVAL = duration * 10  # 벤치마크 중에는 주기 통계 출력 생략
+    ws.r = ws.connect_redis() if use_redis else NullRedis()
+    # NullRedis는 동기 클라이언트 인터페이스만 흉내 냄
+    ws.REDIS_CLIENT = ws.REDIS_CLIENT if use_redis else 'sync'
+
+    async def main():
+        client = asyncio.create_task(ws.upbit_ws_client(
+            replay_server.synthetic_markets(markets), uri=f"ws://127.0.0.1:{port}", seed_prices=False))
+        await asyncio.sleep(duration + DRAIN_SECONDS)
+        client.cancel()
+
+    asyncio.run(main())
+    # 처리 워커별 큐 카운터 합계
+    stats = {name: sum(queue.stats[name] for queue in queues) for name in ('dropped', 'coalesced', 'spilled')}
+    results.put({
+        'received': received[0],
+        'processed': processed[0],
+        'p50_ms': (percentile(latencies, 50) or 0) / 1e6,
+        'p99_ms': (percentile(latencies, 99) or 0) / 1e6,
+        'dropped': stats.get('dropped', 0),
+        'coalesced': stats.get('coalesced', 0),
+        'spilled': stats.get('spilled', 0),
+    })
+
+
+def run_step(port, policy, rate, duration, markets, use_redis, workers=1):
+    server = multiprocessing.Process(target=run_server, args=(port, rate, duration, markets), daemon=True)
+    server.start()
+    time.sleep(0.5)
+    results = multiprocessing.Queue()
+    client = multiprocessing.Process(target=run_client,
+                                     args=(port, policy, duration, markets, use_redis, workers, results))
+    client.start()
+    result = results.get()
+    client.join()
+    server.terminate()
+    server.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="upbit_ws_client ingest benchmark")
+    parser.add_argument('--policies', nargs='+', default=list(QUEUE_POLICIES))
+    parser.add_argument('--rates', nargs='+', type=float, default=[1000, 2000, 5000, 10000, 20000])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--markets', type=int, default=200)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--redis', action='store_true', help="localhost Redis에 실제로 기록")
+    parser.add_argument('--workers', type=int, default=1, help="연결당 처리 워커 수 (CONSUMER_WORKERS)")
+    args = parser.parse_args(argv)
+
+    print(f"{'policy':<12}{'rate':>9}{'received':>10}{'processed':>11}{'p50(ms)':>10}{'p99(ms)':>10}"
+          f"{'dropped':>9}{'coalesced':>11}{'spilled':>9}")
+    for policy in args.policies:
+        sustainable = 0
+        for rate in args.rates:
+            result = run_step(args.port, policy, rate, args.duration, args.markets, args.redis, args.workers)
+            print(f"{policy:<12}{rate:>9.0f}{result['received']:>10}{result['processed']:>11}{result['p50_ms']:>10.2f}"
+                  f"{result['p99_ms']:>10.2f}{result['dropped']:>9}{result['coalesced']:>11}{result['spilled']:>9}")
+            if result['received'] < rate * args.duration * 0.95:
+                print(f"{policy}: replay server could not reach {rate:.0f} msgs/s, stopping")
+                break
+            if (result['dropped'] == 0 and result['spilled'] == 0
+                    and result['processed'] >= result['received'] * 0.99 and result['p99_ms'] < 1000):
+                sustainable = rate
+        print(f"{policy}: max sustainable rate = {sustainable:.0f} msgs/s\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Redis 클라이언트(sync / async) 별 수신 -> 기록 완료 지연 벤치마크 (로컬 리플레이 서버 + 실제 Redis)
+
+같은 리플레이 피드에 upbit_ws_client를 REDIS_CLIENT='sync'와 'async'로 각각 붙여 비교한다.
+  - receive-to-commit: 프레임을 받은 시각 -> 그 체결이 든 1초봉이 Redis에 기록 완료된 시각
+    (버킷이 닫힐 때까지 기다리는 시간 1초 + BUCKET_CLOSE_GRACE가 바닥값으로 포함됨)
+  - flush: 파이프라인 기록 한 번에 걸린 시간 (sync에서는 이 시간 동안 수신이 멈춤)
+localhost:6379 Redis가 떠 있어야 한다.
+
+예) python test/benchmark_redis_client.py --rate 10000 --markets 1000 --duration 20
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import replay_server
+import upbit_websocket as ws
+from benchmark_ingest import DRAIN_SECONDS, percentile, run_server
+from trade_aggregator import CandleEngine
+from ws_decoder import decode_trade
+
+
+def run_client(port, client, policy, duration, markets, results):
+    """한 가지 Redis 클라이언트로 upbit_ws_client를 실행하고 결과를 results에 넣음"""
+    received_ns = dict()  # 1초봉 시작 ts -> [수신 시각(ns), ...]
+    latencies = []
+    flushes = []
+
+    def decode_bench_trade(frame):
+        trade = decode_trade(frame)
+        received_ns.setdefault(trade.tms - trade.tms % 1000, []).append(time.time_ns())
+        return trade
+
+    class MeasuredEngine(CandleEngine):
+        def _collect(self, pipe, now_ms):
+            collected, buckets, commands = super()._collect(pipe, now_ms)
+            one_second = self.aggregators['1s']
+            self.committing = [ts for aggregator, ready, _ in collected if aggregator is one_second for ts in ready]
+            return collected, buckets, commands
+
+        def _committed(self, started_ns):
+            committed_ns = time.time_ns()
+            if self.committing:
+                flushes.append(committed_ns - started_ns)
+            for base_timestamp in self.committing:
+                latencies.extend(committed_ns - recv_ns for recv_ns in received_ns.pop(base_timestamp, ()))
+
+        def flush(self, r, now_ms):
+            started_ns = time.time_ns()
+            result = super().flush(r, now_ms)
+            self._committed(started_ns)
+            return result
+
+        async def flush_async(self, r, now_ms):
+            started_ns = time.time_ns()
+            result = await super().flush_async(r, now_ms)
+            self._committed(started_ns)
+            return result
+
+    ws.CandleEngine = MeasuredEngine
+    ws.decode_trade = decode_bench_trade
+    ws.QUEUE_POLICY = policy
+    ws.REDIS_CLIENT = client
+    ws.BACKFILL_ON_RECONNECT = False
+    ws.STATS_INTERVAL = duration * 10  # 벤치마크 중에는 주기 통계 출력 생략
+    ws.r = ws.connect_redis()
+
+    async def main():
+        task = asyncio.create_task(ws.upbit_ws_client(
+            replay_server.synthetic_markets(markets), uri=f"ws://127.0.0.1:{port}", seed_prices=False))
+        await asyncio.sleep(duration + DRAIN_SECONDS)
+        task.cancel()
+
+    asyncio.run(main())
+    results.put({
+        'committed': len(latencies),
+        'p50_ms': (percentile(latencies, 50) or 0) / 1e6,
+        'p99_ms': (percentile(latencies, 99) or 0) / 1e6,
+        'max_ms': max(latencies, default=0) / 1e6,
+        'flush_p50_ms': (percentile(flushes, 50) or 0) / 1e6,
+        'flush_max_ms': max(flushes, default=0) / 1e6,
+    })
+
+
+def run_step(port, client, policy, rate, duration, markets):
+    server = multiprocessing.Process(target=run_server, args=(port, rate, duration, markets), daemon=True)
+    server.start()
+    time.sleep(0.5)
+    results = multiprocessing.Queue()
+    worker = multiprocessing.Process(target=run_client,
+                                     args=(port, client, policy, duration, markets, results))
+    worker.start()
+    result = results.get()
+    worker.join()
+    server.terminate()
+    server.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="sync vs asyncio Redis receive-to-commit benchmark")
+    parser.add_argument('--clients', nargs='+', default=['sync', 'async'])
+    parser.add_argument('--policy', default=ws.QUEUE_POLICY)
+    parser.add_argument('--rate', type=float, default=10000)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--markets', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    print(f"{'client':<8}{'committed':>11}{'p50(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}"
+          f"{'flush p50':>11}{'flush max':>11}")
+    for client in args.clients:
+        result = run_step(args.port, client, args.policy, args.rate, args.duration, args.markets)
+        print(f"{client:<8}{result['committed']:>11}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+              f"{result['max_ms']:>10.1f}{result['flush_p50_ms']:>11.2f}{result['flush_max_ms']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+공유 메모리 링 버퍼(CONSUMER_HANDOFF='ring') 처리량 벤치마크
+
+1) handoff: 수신 프로세스 -> 처리 프로세스 전달만 측정 (디코딩/집계 없음)
+   - queue: 튜플 묶음을 multiprocessing 큐로 (ProcessConsumerPool과 같은 방식)
+   - ring : TradeRing에 고정 크기 레코드로 씀
+   송신 쪽 CPU 시간(메시지당)과 받는 쪽이 Trade로 복원까지 마친 처리량을 비교한다.
+2) ingest: 로컬 리플레이 서버에 upbit_ws_client를 붙여 단일 프로세스 / queue / ring 모드의
+   수신량 대비 집계량을 rate별로 측정 (localhost:6379 Redis 필요)
+
+예) python test/benchmark_ring.py --count 1000000
+    python test/benchmark_ring.py --skip-handoff --rates 5000 10000 20000 --workers 2
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import replay_server
+import upbit_websocket as ws
+from benchmark_ingest import DRAIN_SECONDS, run_server
+from trade_aggregator import CandleEngine
+from trade_ring import TradeRing
+from ws_decoder import Trade, decode_trade
+
+
+BATCH_SIZE = 1000
+
+
+def make_trades(count, markets):
+    codes = replay_server.synthetic_markets(markets)
+    now_ms = int(time.time() * 1000)
+    return [Trade(codes[i % markets], now_ms + i // 1000, 100.0 + i % 7, 0.5, 'ASK' if i % 2 else 'BID', i, time.time_ns())
+            for i in range(count)]
+
+
+def queue_reader(handoff, count, done):
+    received = 0
+    while received < count:
+        batch = handoff.get()
+        for item in batch:
+            Trade(*item)
+        received += len(batch)
+    done.put(time.perf_counter())
+
+
+def ring_reader(name, count, done):
+    ring = TradeRing.attach(name)
+    received = 0
+    while received < count:
+        trades = ring.read(BATCH_SIZE)
+        if not trades:
+            time.sleep(0.0001)
+        received += len(trades)
+    ring.close()
+    done.put(time.perf_counter())
+
+
+def bench_handoff(method, trades):
+    done = multiprocessing.Queue()
+    if method == 'queue':
+        handoff = multiprocessing.Queue()
+        reader = multiprocessing.Process(target=queue_reader, args=(handoff, len(trades), done))
+    else:
+        ring = TradeRing.create(ws.RING_CAPACITY)
+        reader = multiprocessing.Process(target=ring_reader, args=(ring.name, len(trades), done))
+    reader.start()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    if method == 'queue':
+        for i in range(0, len(trades), BATCH_SIZE):
+            handoff.put([trade.to_tuple() for trade in trades[i:i + BATCH_SIZE]])
+    else:
+        # ProcessConsumerPool과 같은 크기의 묶음으로 씀 (RingConsumerPool은 HANDOFF_INTERVAL마다 모아서 씀)
+        for i in range(0, len(trades), BATCH_SIZE):
+            batch = trades[i:i + BATCH_SIZE]
+            sent = 0
+            while sent < len(batch):
+                written = ring.write_many(batch, sent)
+                if not written:
+                    time.sleep(0.0001)
+                sent += written
+    finished = done.get()
+    # queue는 pickle/파이프 쓰기를 피더 스레드가 하므로 받는 쪽이 끝난 뒤에 송신 프로세스 CPU 시간을 잼
+    sender_cpu = time.process_time() - cpu_started
+    reader.join()
+    if method == 'ring':
+        ring.unlink()
+    return {'sender_us': sender_cpu / len(trades) * 1e6, 'rate': len(trades) / (finished - started)}
+
+
+def run_client(port, mode, workers, policy, duration, markets, results):
+    """한 가지 모드로 upbit_ws_client를 실행하고 수신/집계 수를 results에 넣음"""
+    # 처리 워커 프로세스는 fork로 만들어지므로 공유 배열에 워커별 집계 수를 모음
+    processed = multiprocessing.Array('q', 64, lock=False)
+    slots = multiprocessing.Value('i', 0)
+    received = [0]
+
+    class MeasuredEngine(CandleEngine):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            with slots.get_lock():
+                self.slot = slots.value
+                slots.value += 1
+
+        def add(self, trade):
+            super().add(trade)
+            processed[self.slot] += 1
+
+        def merge(self, partial):
+            super().merge(partial)
+            processed[self.slot] += partial.count
+
+    def decode_bench_trade(frame):
+        received[0] += 1
+        return decode_trade(frame)
+
+    ws.CandleEngine = MeasuredEngine
+    ws.decode_trade = decode_bench_trade
+    ws.QUEUE_POLICY = policy
+    ws.CONSUMER_WORKERS = workers
+    ws.CONSUMER_PROCESSES = mode != 'single'
+    ws.CONSUMER_HANDOFF = mode
+    ws.METRICS_PORT = None
+    ws.BACKFILL_ON_RECONNECT = False
+    ws.STATS_INTERVAL = duration * 10  # 벤치마크 중에는 주기 통계 출력 생략
+    ws.r = ws.connect_redis()
+
+    async def main():
+        task = asyncio.create_task(ws.upbit_ws_client(
+            replay_server.synthetic_markets(markets), uri=f"ws://127.0.0.1:{port}", seed_prices=False))
+        await asyncio.sleep(duration + DRAIN_SECONDS)
+        task.cancel()
+
+    asyncio.run(main())
+    results.put({'received': received[0], 'processed': sum(processed)})
+
+
+def run_step(port, mode, workers, policy, rate, duration, markets):
+    server = multiprocessing.Process(target=run_server, args=(port, rate, duration, markets), daemon=True)
+    server.start()
+    time.sleep(0.5)
+    results = multiprocessing.Queue()
+    client = multiprocessing.Process(target=run_client,
+                                     args=(port, mode, workers, policy, duration, markets, results))
+    client.start()
+    result = results.get()
+    client.join()
+    server.terminate()
+    server.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="shared-memory ring buffer benchmark")
+    parser.add_argument('--count', type=int, default=500000, help="handoff 벤치마크 체결 수")
+    parser.add_argument('--skip-handoff', action='store_true')
+    parser.add_argument('--modes', nargs='+', default=['single', 'queue', 'ring'])
+    parser.add_argument('--rates', nargs='*', type=float, default=[5000, 10000, 20000])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--markets', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=1, help="처리 워커 수 (CONSUMER_WORKERS)")
+    parser.add_argument('--policy', default='drop_oldest')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args(argv)
+    print(f"cpus={os.cpu_count()}")
+
+    if not args.skip_handoff:
+        trades = make_trades(args.count, args.markets)
+        print(f"{'handoff':<8}{'sender us/msg':>15}{'msgs/s':>12}")
+        for method in ('queue', 'ring'):
+            result = bench_handoff(method, trades)
+            print(f"{method:<8}{result['sender_us']:>15.2f}{result['rate']:>12.0f}")
+        print()
+
+    if not args.rates:
+        return
+    print(f"{'mode':<8}{'rate':>9}{'received':>10}{'processed':>11}{'ratio':>8}")
+    for mode in args.modes:
+        for rate in args.rates:
+            result = run_step(args.port, mode, args.workers, args.policy, rate, args.duration, args.markets)
+            ratio = result['processed'] / result['received'] if result['received'] else 0
+            print(f"{mode:<8}{rate:>9.0f}{result['received']:>10}{result['processed']:>11}{ratio:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
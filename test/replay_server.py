@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+로컬 웹소켓 리플레이 서버 (Upbit SIMPLE 포맷 체결 프레임)
+
+실제 Upbit 대신 로컬에서 같은 형식의 프레임을 보내 재현 가능한 벤치마크를 만든다.
+  - journal  : frame_journal로 기록한 실제 프레임을 원래 간격의 1/speed로 재생 (1x ~ 100x)
+  - synthetic: 지정한 초당 메시지 수로 가짜 체결 생성
+
+보낼 때 tms를 현재 시각으로 바꾸고, 벤치마크용 송신 시각(bts, ns)을 추가한다.
+
+예) python test/replay_server.py --synthetic --rate 5000
+    python test/replay_server.py --journal journal/main --speed 10
+    python test/replay_server.py --synthetic --rate 1000 --stall-after 5
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import time
+
+import orjson
+import websockets
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_journal import JournalReader
+
+
+TICK = 0.005  # 프레임 전송 단위 시간(초)
+
+
+def synthetic_markets(count=200):
+    return [f"KRW-T{i:03d}" for i in range(count)]
+
+
+def synthetic_trades(markets):
+    """무한히 이어지는 가짜 체결 dict 생성"""
+    prices = dict()
+    for sid in itertools.count(1):
+        # markets는 재구독으로 바뀔 수 있음
+        market = random.choice(markets)
+        prices[market] = prices.get(market, random.uniform(100, 100000)) * (1 + random.uniform(-0.001, 0.001))
+        yield {
+            'ty': 'trade', 'cd': market, 'tp': round(prices[market], 2),
+            'tv': round(random.expovariate(1.0), 8), 'ab': random.choice(('ASK', 'BID')),
+            'pcp': prices[market], 'c': 'EVEN', 'cp': 0, 'td': '', 'ttm': '',
+            'ttms': 0, 'tms': 0, 'sid': sid, 'st': 'REALTIME',
+        }
+
+
+def stamp(trade):
+    """전송 직전에 tms(ms)와 bts(ns)를 현재 시각으로 설정해 프레임으로 변환"""
+    now_ns = time.time_ns()
+    trade['tms'] = now_ns // 1_000_000
+    trade['ttms'] = trade['tms']
+    trade['bts'] = now_ns
+    return orjson.dumps(trade)
+
+
+async def send_synthetic(websocket, markets, rate, duration):
+    """초당 rate개 속도로 가짜 체결 전송, 보낸 개수 반환"""
+    trades = synthetic_trades(markets)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    sent = 0
+    while duration is None or loop.time() - started < duration:
+        # 지금까지 보냈어야 할 개수만큼 몰아서 전송 (sleep 오차 보정)
+        due = int((loop.time() - started) * rate)
+        for _ in range(due - sent):
+            await websocket.send(stamp(next(trades)))
+        sent = max(sent, due)
+        await asyncio.sleep(TICK)
+    return sent
+
+
+async def send_journal(websocket, directory, speed):
+    """기록된 프레임을 원래 간격의 1/speed로 재생"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    first_ns = None
+    sent = 0
+    for recv_ns, frame in JournalReader(directory).read():
+        if first_ns is None:
+            first_ns = recv_ns
+        delay = (recv_ns - first_ns) / 1e9 / speed - (loop.time() - started)
+        if delay > TICK:
+            await asyncio.sleep(delay)
+        await websocket.send(stamp(orjson.loads(bytes(frame))))
+        sent += 1
+    return sent
+
+
+def make_handler(args):
+    stalled = []
+    async def handler(websocket, path=None):
+        # 클라이언트의 구독 메시지를 받은 뒤 전송 시작
+        subscribe = orjson.loads(await websocket.recv())
+        codes = next((item['codes'] for item in subscribe if item.get('type') == 'trade'), None)
+        markets = list(codes or synthetic_markets(args.markets))
+        pong_task = asyncio.create_task(answer_pings(websocket, markets))
+        try:
+            if args.journal:
+                sent = await send_journal(websocket, args.journal, args.speed)
+            elif args.stall_after and not stalled:
+                # 첫 연결만: 전송과 PING 응답을 멈추고 연결은 열어 둠 (half-open 연결 흉내)
+                sent = await send_synthetic(websocket, markets, args.rate, args.stall_after)
+                stalled.append(True)
+                pong_task.cancel()
+                print(f"Stalling after {sent} frames")
+                await asyncio.Future()
+            else:
+                sent = await send_synthetic(websocket, markets, args.rate, args.duration)
+            print(f"Replay finished: sent {sent} frames")
+            # 재연결/백필이 일어나지 않도록 클라이언트가 끊을 때까지 연결 유지
+            await websocket.wait_closed()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            pong_task.cancel()
+    return handler
+
+
+async def answer_pings(websocket, markets):
+    """업비트처럼 클라이언트의 "PING"에 {"status":"UP"}으로 응답하고, 다시 구독하면 보낼 마켓을 바꿈"""
+    try:
+        async for message in websocket:
+            if message == "PING":
+                await websocket.send(b'{"status":"UP"}')
+                continue
+            codes = next((item['codes'] for item in orjson.loads(message) if item.get('type') == 'trade'), None)
+            if codes:
+                markets[:] = codes
+                print(f"Resubscribed: {len(codes)} markets")
+    except websockets.exceptions.ConnectionClosed:
+        pass
+
+
+async def serve(args):
+    async with websockets.serve(make_handler(args), args.host, args.port, max_queue=None):
+        print(f"Replay server listening on ws://{args.host}:{args.port}")
+        await asyncio.Future()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upbit SIMPLE trade replay server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--journal', help="frame_journal 세그먼트 폴더")
+    parser.add_argument('--speed', type=float, default=1.0, help="journal 재생 배속 (1 ~ 100)")
+    parser.add_argument('--synthetic', action='store_true', help="가짜 체결 생성 (기본값)")
+    parser.add_argument('--rate', type=float, default=1000, help="synthetic 초당 메시지 수")
+    parser.add_argument('--duration', type=float, default=None, help="synthetic 전송 시간(초)")
+    parser.add_argument('--markets', type=int, default=200, help="synthetic 마켓 수")
+    parser.add_argument('--stall-after', type=float, default=None,
+                        help="첫 연결에서 이 시간(초) 뒤 응답 없이 멈춤 (재연결 테스트용)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(serve(parse_args()))
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+10초 봉 기록 루프 공용 틱 스케줄러 (*_by_seconds.py)
+
+매 주기 datetime.now()로 다음 구간까지 남은 시간을 다시 계산하거나 time.sleep(10)을 하면,
+루프 본문이 오래 걸린 주기 뒤에 같은 봉을 두 번 기록하거나 한 봉을 말없이 건너뛰고, 주기가 조금씩 밀린다.
+  - 틱 번호(index)를 기준으로 다음 틱을 정함: 틱 index는 벽시계 index * interval + offset초에 시작하고
+    직전 구간(index - 1)의 봉을 기록한다. 번호는 항상 1씩 증가하므로 같은 봉을 두 번 내주지 않는다.
+  - 대기는 monotonic 시계로 함 (NTP 등으로 벽시계가 바뀌어도 주기가 흔들리지 않음).
+    벽시계와 RESYNC_THRESHOLD 이상 벌어지면 기준점을 다시 잡되, 틱 번호는 되돌리지 않는다.
+  - 본문이 늦어 틱을 놓쳤으면 최근 max_catchup개까지는 늦게라도 실행하고(caught_up), 그보다 오래된 틱은
+    missed로 세고 출력한다.
+  - 틱마다 예정 시각 대비 시작 지연(skew)을 tick_start_skew_seconds 히스토그램에 기록하고,
+    SKEW_WARN_THRESHOLD를 넘으면 출력한다.
+"""
+
+import asyncio
+import math
+import time
+from datetime import datetime
+
+from ingest_metrics import METRICS
+
+
+TICK_INTERVAL = 10           # 틱 주기(초)
+MAX_CATCHUP = 1              # 늦었을 때 늦게라도 실행할 최근 틱 수, 그보다 오래된 틱은 missed
+SKEW_WARN_THRESHOLD = 1.0    # 틱 시작이 이보다 늦으면 출력(초)
+RESYNC_THRESHOLD = 1.0       # monotonic 기준 추정 시각과 벽시계가 이만큼 벌어지면 기준점을 다시 잡음(초)
+
+
+def format_bucket(bucket_index, interval=TICK_INTERVAL):
+    """봉 번호의 시작 시각 ('%Y-%m-%d %H:%M:%S')"""
+    return datetime.fromtimestamp(bucket_index * interval).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Tick:
+    __slots__ = ('index', 'interval', 'scheduled', 'skew', 'caught_up')
+
+    def __init__(self, index, interval, scheduled, skew, caught_up):
+        self.index = index
+        self.interval = interval
+        self.scheduled = scheduled    # 예정 시작 시각 (epoch 초)
+        self.skew = skew              # 예정 시각 대비 실제 시작 지연(초)
+        self.caught_up = caught_up    # 본문이 늦어 예정보다 한 주기 이상 늦게 실행되는 틱
+
+    @property
+    def bucket_start(self):
+        """이 틱이 기록할 봉의 시작 시각 (epoch 초)"""
+        return (self.index - 1) * self.interval
+
+    @property
+    def bucket_ms(self):
+        return self.bucket_start * 1000
+
+    @property
+    def formatted_time(self):
+        """기록할 봉의 시각 ('%Y-%m-%d %H:%M:%S')"""
+        return format_bucket(self.index - 1, self.interval)
+
+
+class TickScheduler:
+    """monotonic 시계 기준 틱 스케줄러 (next_tick / next_tick_async가 다음 틱을 기다려 반환)"""
+
+    def __init__(self, name, interval=TICK_INTERVAL, offset=0, max_catchup=MAX_CATCHUP,
+                 skew_warn_threshold=SKEW_WARN_THRESHOLD, registry=METRICS):
+        self.name = name
+        self.interval = interval
+        self.offset = offset                  # 구간 경계 뒤 이 시간(초)만큼 기다렸다 시작 (집계기가 봉을 닫을 시간)
+        self.max_catchup = max_catchup
+        self.skew_warn_threshold = skew_warn_threshold
+        self.skew_histogram = registry.histogram('tick_start_skew_seconds',
+                                                 "Delay between scheduled and actual tick start", job=name)
+        self.missed_counter = registry.counter('ticks_missed_total',
+                                               "Ticks skipped because the loop fell behind", job=name)
+        self._anchor()
+        # 시작 직후의 첫 틱은 다음 경계부터 (이미 지난 경계의 틱은 실행하지 않음)
+        self.next_index = self._index_at(self.now()) + 1
+
+    def _anchor(self):
+        self.anchor_wall = time.time()
+        self.anchor_mono = time.monotonic()
+
+    def now(self):
+        """monotonic 시계로 추정한 현재 벽시계 시각 (epoch 초)"""
+        return self.anchor_wall + (time.monotonic() - self.anchor_mono)
+
+    def _index_at(self, wall):
+        return math.floor((wall - self.offset) / self.interval)
+
+    def _scheduled(self, index):
+        return index * self.interval + self.offset
+
+    def _delay(self):
+        """다음 틱까지 기다릴 시간(초)"""
+        if abs(time.time() - self.now()) >= RESYNC_THRESHOLD:
+            print(f"[{self.name}] wall clock moved by {time.time() - self.now():+.1f}s, resyncing")
+            self._anchor()
+        return self._scheduled(self.next_index) - self.now()
+
+    def _take(self):
+        """기다린 뒤 실행할 틱 결정 (놓친 틱은 missed로 세고 건너뜀)"""
+        current = self._index_at(self.now())
+        oldest = current - self.max_catchup + 1
+        if self.next_index < oldest:
+            missed = oldest - self.next_index
+            self.missed_counter.inc(missed)
+            print(f"[{self.name}] missed {missed} tick(s) "
+                  f"({format_bucket(self.next_index - 1, self.interval)} ~ {format_bucket(oldest - 2, self.interval)})")
+            self.next_index = oldest
+        index = self.next_index
+        self.next_index += 1
+        scheduled = self._scheduled(index)
+        skew = max(self.now() - scheduled, 0.0)
+        self.skew_histogram.record(skew * 1e6)
+        tick = Tick(index, self.interval, scheduled, skew, index < current)
+        if skew >= self.skew_warn_threshold:
+            print(f"[{self.name}] tick {tick.formatted_time} started {skew:.2f}s late"
+                  + (" (catching up)" if tick.caught_up else ""))
+        return tick
+
+    def next_tick(self):
+        """다음 틱까지 대기 (동기 루프용)"""
+        # sleep이 경계보다 아주 조금 일찍 깨어나도 봉이 닫히기 전에 시작하지 않도록 다시 확인
+        while (delay := self._delay()) > 0:
+            time.sleep(delay)
+        return self._take()
+
+    async def next_tick_async(self):
+        """다음 틱까지 대기 (asyncio 루프용)"""
+        while (delay := self._delay()) > 0:
+            await asyncio.sleep(delay)
+        return self._take()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+주기(틱) 하나를 구성하는 독립적인 조회 단계를 동시에 실행하고 단계별 소요 시간을 기록
+
+각 단계는 자기 마감 시간(deadline)을 가지며, 마감을 넘기거나 실패한 단계는 결과 없이(None)
+끝나므로 틱 전체가 늦어지지 않고 그 값만 빠진 행을 기록할 수 있다.
+"""
+
+import asyncio
+import time
+
+
+class StageResult:
+    __slots__ = ('name', 'value', 'status', 'elapsed')
+
+    def __init__(self, name, value, status, elapsed):
+        self.name = name
+        self.value = value        # 실패/시간 초과면 None
+        self.status = status      # 'ok' / 'timeout' / 'error'
+        self.elapsed = elapsed    # 초
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+
+async def run_stage(name, coro, deadline=None):
+    """코루틴 하나를 deadline(초) 안에 실행 (None이면 제한 없음)"""
+    started = time.perf_counter()
+    try:
+        value = await asyncio.wait_for(coro, deadline)
+        status = 'ok'
+    except asyncio.TimeoutError:
+        value, status = None, 'timeout'
+        print(f"[{name}] missed its {deadline}s deadline")
+    except Exception as e:
+        value, status = None, 'error'
+        print(f"[{name}] failed: {e}")
+    return StageResult(name, value, status, time.perf_counter() - started)
+
+
+async def run_stages(stages):
+    """{이름: (코루틴, deadline)}을 동시에 실행해 {이름: StageResult} 반환"""
+    results = await asyncio.gather(*(run_stage(name, coro, deadline)
+                                     for name, (coro, deadline) in stages.items()))
+    return {result.name: result for result in results}
+
+
+def format_timings(results):
+    """'ticker=120ms volume=3ms(timeout)' 형태의 단계별 소요 시간"""
+    return ' '.join(f"{result.name}={result.elapsed * 1000:.0f}ms" + ('' if result.ok else f"({result.status})")
+                    for result in results)
@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+웹소켓 체결 데이터를 메모리에서 버킷(봉) 단위로 집계
+
+체결마다 Redis에 쓰지 않고, 버킷이 닫힐 때 마켓별 통계를 한 번에 기록한다.
+  - trade_volume:{base_timestamp} : market -> volume (10초, 기존 형식 유지)
+  - trade_stats:{base_timestamp}  : market -> JSON 통계 (10초 OHLCV, VWAP, 매수/매도 거래량 등)
+  - candle_1s:{base_timestamp}, candle_1m:{base_timestamp} : 1초/1분 봉 (trade_stats와 같은 형식)
+  - trade_stats_stream : 10초 봉을 (다시) 기록할 때마다 엔트리 하나 (ts, part, parts, rev, data)
+    집계기(샤드/처리 워커)가 여럿이면 각자 자기 마켓만 담은 part를 보내고, parts는 전체 part 수
+    담당 마켓이 없거나 아직 체결을 받지 못한 집계기도 시작 시점부터 봉마다 (빈) part를 보낸다.
+    rev는 처음 닫힐 때 0, 늦은 체결/백필로 다시 기록할 때마다 1씩 증가 (소비자는 같은 봉을 덮어씀)
+
+체결이 없는 마켓은 직전 종가로 거래량 0인 봉을 채워서 기록한다.
+"""
+
+import orjson
+
+
+class TradeBucket:
+    """한 마켓의 한 버킷 동안의 체결 통계"""
+    __slots__ = ('market', 'base_timestamp', 'volume', 'notional', 'count',
+                 'open', 'high', 'low', 'close', 'buy_volume', 'sell_volume',
+                 'first_tms', 'last_tms', 'rts')
+
+    def __init__(self, market, base_timestamp):
+        self.market = market
+        self.base_timestamp = base_timestamp
+        self.volume = 0.0
+        self.notional = 0.0
+        self.count = 0
+        self.open = None
+        self.high = None
+        self.low = None
+        self.close = None
+        self.buy_volume = 0.0
+        self.sell_volume = 0.0
+        self.first_tms = None
+        self.last_tms = None
+        self.rts = 0  # 큐에서 합쳐질 때 첫 체결의 수신 시각(ns)
+
+    def add(self, price, volume, ask_bid, tms):
+        """체결 한 건 반영 (ask_bid: 'BID' 매수 체결, 'ASK' 매도 체결)"""
+        if self.count == 0:
+            self.open = self.high = self.low = self.close = price
+            self.first_tms = self.last_tms = tms
+        else:
+            if price > self.high:
+                self.high = price
+            if price < self.low:
+                self.low = price
+            # 체결 순서가 뒤바뀌어 들어와도 시가/종가는 체결 시각 기준으로 유지
+            if tms < self.first_tms:
+                self.open = price
+                self.first_tms = tms
+            if tms >= self.last_tms:
+                self.close = price
+                self.last_tms = tms
+        self.volume += volume
+        self.notional += price * volume
+        self.count += 1
+        if ask_bid == 'BID':
+            self.buy_volume += volume
+        else:
+            self.sell_volume += volume
+
+    @classmethod
+    def carry(cls, market, base_timestamp, price):
+        """체결이 없는 구간의 봉 (직전 종가로 OHLC를 채우고 거래량은 0)"""
+        bucket = cls(market, base_timestamp)
+        bucket.open = bucket.high = bucket.low = bucket.close = price
+        return bucket
+
+    def merge(self, other):
+        """같은 마켓/버킷의 부분 집계를 합침"""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.open, self.high, self.low, self.close = other.open, other.high, other.low, other.close
+            self.first_tms, self.last_tms = other.first_tms, other.last_tms
+        else:
+            self.high = max(self.high, other.high)
+            self.low = min(self.low, other.low)
+            if other.first_tms < self.first_tms:
+                self.open = other.open
+                self.first_tms = other.first_tms
+            if other.last_tms >= self.last_tms:
+                self.close = other.close
+                self.last_tms = other.last_tms
+        self.volume += other.volume
+        self.notional += other.notional
+        self.count += other.count
+        self.buy_volume += other.buy_volume
+        self.sell_volume += other.sell_volume
+
+    @property
+    def vwap(self):
+        return self.notional / self.volume if self.volume else None
+
+    def to_dict(self):
+        return {
+            'open': self.open,
+            'high': self.high,
+            'low': self.low,
+            'close': self.close,
+            'volume': self.volume,
+            'amount': self.notional,
+            'vwap': self.vwap,
+            'count': self.count,
+            'buy_volume': self.buy_volume,
+            'sell_volume': self.sell_volume,
+        }
+
+
+class BucketAggregator:
+    """
+    열린 버킷을 메모리에 유지하다가, 버킷 종료 시각 + grace가 지나면 Redis에 한 번 기록
+
+    닫힌 버킷은 ttl 동안 메모리에 남겨 두고, 늦게 도착한 체결(재연결 등)이 있으면
+    해당 버킷을 다시 기록한다.
+    """
+
+    def __init__(self, interval_ms=10000, stats_prefix='trade_stats',
+                 volume_prefix='trade_volume', ttl=60, grace_ms=500,
+                 stream=None, stream_part='main', stream_parts=1, stream_maxlen=10000):
+        self.interval_ms = interval_ms
+        self.stats_prefix = stats_prefix
+        self.volume_prefix = volume_prefix
+        self.ttl = ttl
+        self.grace_ms = grace_ms
+        self.stream = stream                # 닫힌 버킷을 알릴 Redis Stream (None이면 보내지 않음)
+        self.stream_part = stream_part
+        self.stream_parts = stream_parts
+        self.stream_maxlen = stream_maxlen
+        self.revisions = dict()             # base_timestamp -> 스트림에 보낸 횟수 (다음 엔트리의 rev)
+        self.published = []                 # 이번 collect에서 보낸 버킷 (기록 실패 시 횟수를 되돌림)
+        self.open_buckets = dict()    # base_timestamp -> {market: TradeBucket}
+        self.closed_buckets = dict()  # base_timestamp -> {market: TradeBucket}
+        self.dirty = set()            # 다시 기록해야 하는 닫힌 버킷
+        self.last_close = dict()      # market -> 직전 봉 종가 (빈 봉 채우기용)
+        self.delisted = set()         # 상장 폐지되어 빈 봉을 채우지 않는 마켓
+        self.next_close_ts = None     # 다음에 닫을 버킷의 시작 시각
+        self.last_close_ms = 0
+        self.late_trades = 0
+        self.dropped_trades = 0
+
+    def bucket_of(self, tms):
+        return tms - (tms % self.interval_ms)
+
+    def seed_prices(self, prices):
+        """시작 시점의 가격으로 종가를 초기화 (첫 체결 전에도 빈 봉을 채울 수 있도록)"""
+        for market, price in prices.items():
+            self.last_close.setdefault(market, float(price))
+
+    def forget_markets(self, markets):
+        """상장 폐지된 마켓의 빈 봉 채우기를 멈춤 (이미 열린 버킷은 그대로 닫힘)"""
+        for market in markets:
+            self.last_close.pop(market, None)
+            self.delisted.add(market)
+
+    def _get_bucket(self, market, base_timestamp):
+        """체결이 속한 TradeBucket 반환 (보존 기간이 지난 버킷이면 None)"""
+        markets = self.open_buckets.get(base_timestamp)
+        if markets is None:
+            if self.next_close_ts is not None and base_timestamp < self.next_close_ts:
+                # 이미 닫힌 버킷에 늦게 도착한 체결
+                markets = self.closed_buckets.get(base_timestamp)
+                if markets is None:
+                    self.dropped_trades += 1
+                    return None
+                self.late_trades += 1
+                self.dirty.add(base_timestamp)
+            else:
+                markets = self.open_buckets[base_timestamp] = dict()
+        bucket = markets.get(market)
+        if bucket is None:
+            bucket = markets[market] = TradeBucket(market, base_timestamp)
+        return bucket
+
+    def add_trade(self, market, price, volume, ask_bid, tms):
+        bucket = self._get_bucket(market, self.bucket_of(tms))
+        if bucket is not None:
+            bucket.add(price, volume, ask_bid, tms)
+
+    def merge(self, partial):
+        """부분 집계(TradeBucket) 반영, partial은 이 주기의 한 버킷 안에 있어야 함"""
+        bucket = self._get_bucket(partial.market, self.bucket_of(partial.first_tms))
+        if bucket is not None:
+            bucket.merge(partial)
+
+    def add(self, trade):
+        """체결(ws_decoder.Trade) 한 건 반영"""
+        self.add_trade(trade.cd, trade.tp, trade.tv, trade.ab, trade.tms)
+
+    def close_due(self, now_ms):
+        """종료 시각이 지난 버킷을 순서대로 닫고, 기록해야 할 버킷 목록 반환"""
+        self.last_close_ms = now_ms
+        if self.next_close_ts is None:
+            # 첫 체결을 기다리지 않고 시작 시점의 버킷부터 닫음 (체결이 없는 워커도 봉마다 스트림 part를 보내도록)
+            self.next_close_ts = min(self.open_buckets, default=self.bucket_of(now_ms))
+
+        expire_before = now_ms - self.ttl * 1000
+        if self.next_close_ts is not None:
+            # 오래 멈춰 있었다면 보존 기간 밖의 구간은 건너뜀
+            self.next_close_ts = max(self.next_close_ts, self.bucket_of(expire_before))
+            while self.next_close_ts + self.interval_ms + self.grace_ms <= now_ms:
+                base_timestamp = self.next_close_ts
+                markets = self.open_buckets.pop(base_timestamp, dict())
+                for market, price in self.last_close.items():
+                    if market not in markets:
+                        markets[market] = TradeBucket.carry(market, base_timestamp, price)
+                for market, bucket in markets.items():
+                    if bucket.close is not None and market not in self.delisted:
+                        self.last_close[market] = bucket.close
+                if markets or self.stream:
+                    # 스트림 소비자는 part 수만큼 엔트리를 기다리므로 담당 마켓이 없어도 빈 part를 보냄
+                    self.closed_buckets[base_timestamp] = markets
+                    self.dirty.add(base_timestamp)
+                self.next_close_ts += self.interval_ms
+            # 보존 기간 이전의 열린 버킷(시계가 크게 튄 경우)은 버림
+            for base_timestamp in [ts for ts in self.open_buckets if ts < self.next_close_ts]:
+                self.dropped_trades += len(self.open_buckets.pop(base_timestamp))
+
+        for base_timestamp in [ts for ts in self.closed_buckets if ts < expire_before]:
+            del self.closed_buckets[base_timestamp]
+            self.dirty.discard(base_timestamp)
+            self.revisions.pop(base_timestamp, None)
+
+        ready = sorted(self.dirty)
+        self.dirty.clear()
+        return ready
+
+    def write(self, pipe, base_timestamp):
+        """닫힌 버킷 하나를 파이프라인에 추가하고 추가한 명령 수 반환"""
+        markets = self.closed_buckets.get(base_timestamp)
+        if not markets:
+            return 0
+        commands = 0
+        if self.volume_prefix:
+            volume_key = f"{self.volume_prefix}:{base_timestamp}"
+            pipe.hset(volume_key, mapping={m: b.volume for m, b in markets.items()})
+            pipe.expire(volume_key, self.ttl)
+            commands += 2
+        stats_key = f"{self.stats_prefix}:{base_timestamp}"
+        pipe.hset(stats_key, mapping={m: orjson.dumps(b.to_dict()) for m, b in markets.items()})
+        pipe.expire(stats_key, self.ttl)
+        return commands + 2
+
+    def publish(self, pipe, base_timestamp):
+        """기록한 버킷을 스트림 엔트리 하나로 알림 (늦은 체결로 다시 기록하면 rev를 올려 다시 보냄)"""
+        markets = self.closed_buckets.get(base_timestamp)
+        if markets is None:
+            return 0
+        revision = self.revisions.get(base_timestamp, 0)
+        pipe.xadd(self.stream, {
+            'ts': base_timestamp,
+            'part': self.stream_part,
+            'parts': self.stream_parts,
+            'rev': revision,
+            'data': orjson.dumps({m: b.to_dict() for m, b in markets.items()}),
+        }, maxlen=self.stream_maxlen, approximate=True)
+        self.revisions[base_timestamp] = revision + 1
+        self.published.append(base_timestamp)
+        return 1
+
+    def restore(self, ready):
+        """기록에 실패한 버킷을 다음 collect에서 같은 rev로 다시 보내도록 되돌림"""
+        self.dirty.update(ready)
+        for base_timestamp in self.published:
+            if base_timestamp in self.revisions:
+                self.revisions[base_timestamp] -= 1
+        self.published = []
+
+    def collect(self, pipe, now_ms):
+        """닫을 버킷을 파이프라인에 추가하고 (버킷 목록, 명령 수) 반환"""
+        ready = self.close_due(now_ms)
+        commands = sum(self.write(pipe, base_timestamp) for base_timestamp in ready)
+        self.published = []
+        if self.stream:
+            # 해시를 쓴 다음에 알려야 소비자가 엔트리를 받았을 때 키도 이미 있음
+            commands += sum(self.publish(pipe, base_timestamp) for base_timestamp in ready)
+        return ready, commands
+
+
+# 주기별 봉 설정 (10초 봉은 기존 trade_volume/trade_stats 키를 그대로 사용)
+CANDLE_INTERVALS = {
+    '1s': {'interval_ms': 1000, 'stats_prefix': 'candle_1s', 'volume_prefix': None, 'ttl': 60, 'stream': None},
+    '10s': {'interval_ms': 10000, 'stats_prefix': 'trade_stats', 'volume_prefix': 'trade_volume', 'ttl': 60,
+            'stream': 'trade_stats_stream'},
+    '1m': {'interval_ms': 60000, 'stats_prefix': 'candle_1m', 'volume_prefix': None, 'ttl': 300, 'stream': None},
+}
+
+
+class CandleEngine:
+    """체결 스트림 하나로 여러 주기(1s/10s/1m)의 OHLCV 봉을 동시에 생성"""
+
+    def __init__(self, intervals=CANDLE_INTERVALS, grace_ms=500, primary='10s', key_prefix='',
+                 stream_part='main', stream_parts=1, min_ttl=None):
+        # key_prefix: 거래소별 Redis 키 접두사 (예: 'bithumb:' -> bithumb:trade_stats:{ts})
+        # stream_part/stream_parts: 이 엔진이 스트림에 보내는 part 이름과 전체 part 수
+        # min_ttl: 닫힌 봉 보존 시간(초)의 하한 (재연결 백필이 끝날 때까지 늦은 체결을 받을 수 있도록)
+        self.aggregators = dict()
+        for name, config in intervals.items():
+            config = dict(config)
+            if min_ttl is not None:
+                config['ttl'] = max(config['ttl'], min_ttl)
+            for prefix in ('stats_prefix', 'volume_prefix', 'stream'):
+                if config.get(prefix):
+                    config[prefix] = key_prefix + config[prefix]
+            self.aggregators[name] = BucketAggregator(grace_ms=grace_ms, stream_part=stream_part,
+                                                      stream_parts=stream_parts, **config)
+        self.primary = self.aggregators[primary]
+
+    @property
+    def open_buckets(self):
+        return self.primary.open_buckets
+
+    @property
+    def late_trades(self):
+        return self.primary.late_trades
+
+    @property
+    def dropped_trades(self):
+        return self.primary.dropped_trades
+
+    def seed_prices(self, prices):
+        for aggregator in self.aggregators.values():
+            aggregator.seed_prices(prices)
+
+    def add_markets(self, prices):
+        """신규 상장(재상장 포함): 현재가를 알면(None이 아니면) 첫 체결 전에도 빈 봉을 채우기 시작"""
+        for aggregator in self.aggregators.values():
+            aggregator.delisted.difference_update(prices)
+        self.seed_prices({market: price for market, price in prices.items() if price is not None})
+
+    def remove_markets(self, markets):
+        """상장 폐지: 마켓별 상태를 버리고 더 이상 봉을 만들지 않음"""
+        for aggregator in self.aggregators.values():
+            aggregator.forget_markets(markets)
+
+    def add(self, trade):
+        """체결(ws_decoder.Trade) 한 건을 모든 주기에 반영"""
+        market, price, volume, ask_bid, tms = trade.cd, trade.tp, trade.tv, trade.ab, trade.tms
+        for aggregator in self.aggregators.values():
+            aggregator.add_trade(market, price, volume, ask_bid, tms)
+
+    def merge(self, partial):
+        """큐에서 합쳐진 부분 집계를 모든 주기에 반영 (가장 짧은 주기 안의 체결만 합쳐져 있어야 함)"""
+        for aggregator in self.aggregators.values():
+            aggregator.merge(partial)
+
+    def closed_until(self, name='1s'):
+        """name 주기에서 이 시각(ms) 이전에 시작한 봉은 모두 닫혔음 (아직 없으면 None)"""
+        return self.aggregators[name].next_close_ts
+
+    def _collect(self, pipe, now_ms):
+        collected = [(aggregator, *aggregator.collect(pipe, now_ms))
+                     for aggregator in self.aggregators.values()]
+        buckets = sum(len(ready) for _, ready, _ in collected)
+        commands = sum(count for _, _, count in collected)
+        return collected, buckets, commands
+
+    @staticmethod
+    def _restore(collected):
+        # 기록에 실패한 버킷은 다음 flush에서 다시 시도
+        for aggregator, ready, _ in collected:
+            aggregator.restore(ready)
+
+    def flush(self, r, now_ms):
+        """모든 주기의 닫힌 봉을 하나의 파이프라인으로 기록하고 (버킷 수, 명령 수) 반환"""
+        pipe = r.pipeline(transaction=False)
+        collected, buckets, commands = self._collect(pipe, now_ms)
+        if commands:
+            try:
+                pipe.execute()
+            except Exception:
+                self._restore(collected)
+                raise
+        return buckets, commands
+
+    async def flush_async(self, r, now_ms):
+        """flush와 같지만 redis.asyncio 클라이언트로 기록 (기록하는 동안 이벤트 루프를 막지 않음)"""
+        pipe = r.pipeline(transaction=False)
+        collected, buckets, commands = self._collect(pipe, now_ms)
+        if commands:
+            try:
+                await pipe.execute()
+            except Exception:
+                self._restore(collected)
+                raise
+        return buckets, commands
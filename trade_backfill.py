@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+웹소켓 재연결 시 끊겨 있던 동안의 체결을 REST(/v1/trades/ticks)로 채워 넣기
+
+마켓별로 마지막으로 받은 체결(sid, tms)을 기억해 두었다가, 재연결 후
+그 이후의 체결을 REST로 받아 같은 큐에 넣는다. 실시간 스트림과 겹치는 체결은
+sequential_id(sid)로 중복 제거한다.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+import aiohttp
+
+from ws_decoder import Trade
+
+
+TRADES_URL = "https://api.upbit.com/v1/trades/ticks"
+
+
+class TradeTracker:
+    """마켓별 마지막 체결 위치 추적 및 sid 기반 중복 제거"""
+
+    def __init__(self, recent_size=2000):
+        self.recent_size = recent_size
+        self.last_seen = dict()     # market -> 마지막 체결 tms
+        self.anchors = dict()       # 연결이 끊긴 시점의 last_seen
+        self.recent_sids = dict()   # market -> (deque, set)
+        self.disconnected_at = None
+        self.pending_gap = dict()   # market -> 아직 채우지 않은 구간의 기준 tms (가장 이른 값)
+        self.duplicates = 0
+        self.backfilled = 0
+
+    def seen(self, trade):
+        """처음 보는 체결이면 기록하고 True, 이미 받은 체결이면 False"""
+        market = trade.cd
+        sid = trade.sid
+        if sid is not None:
+            recent = self.recent_sids.get(market)
+            if recent is None:
+                recent = self.recent_sids[market] = (deque(), set())
+            order, sids = recent
+            if sid in sids:
+                self.duplicates += 1
+                return False
+            order.append(sid)
+            sids.add(sid)
+            if len(order) > self.recent_size:
+                sids.discard(order.popleft())
+        tms = trade.tms
+        if tms > self.last_seen.get(market, 0):
+            self.last_seen[market] = tms
+        return True
+
+    def mark_disconnected(self):
+        """연결이 끊긴 시점의 마켓별 마지막 체결 위치를 저장"""
+        if self.disconnected_at is None:
+            self.disconnected_at = int(time.time() * 1000)
+            self.anchors = dict(self.last_seen)
+
+    def take_gap(self, markets):
+        """재연결 후 채워야 할 (마켓, 기준 tms) 목록 반환, 끊긴 적이 없으면 빈 목록"""
+        if self.disconnected_at is None:
+            return []
+        # 끊기기 전까지 체결이 없던 마켓은 끊긴 시각 이후만 채우면 됨
+        gap = [(market, self.anchors.get(market, self.disconnected_at)) for market in markets]
+        self.disconnected_at = None
+        self.anchors = dict()
+        return gap
+
+    def add_gap(self, gap):
+        """채울 구간을 밀린 목록에 추가 (백필이 도는 중에 다시 끊긴 경우 등, 마켓별로 가장 이른 기준을 유지)"""
+        for market, since_tms in gap:
+            pending = self.pending_gap.get(market)
+            if pending is None or since_tms < pending:
+                self.pending_gap[market] = since_tms
+
+    def take_pending_gap(self):
+        """밀린 구간 전체를 꺼냄 (없으면 빈 목록)"""
+        gap = list(self.pending_gap.items())
+        self.pending_gap = dict()
+        return gap
+
+
+class RateLimiter:
+    """초당 요청 수 제한 (Upbit 시세 API 초당 10회, 같은 IP의 모든 요청 합계)"""
+
+    def __init__(self, per_second):
+        self.interval = 1 / per_second
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            if self.next_slot > now:
+                await asyncio.sleep(self.next_slot - now)
+            self.next_slot = max(now, self.next_slot) + self.interval
+
+
+_limiters = dict()   # 초당 요청 수 -> RateLimiter (프로세스 하나에 하나)
+
+
+def shared_limiter(per_second):
+    """프로세스 안의 모든 연결(샤드)이 함께 쓰는 RateLimiter (여러 샤드가 동시에 백필해도 합계가 한도를 넘지 않도록)"""
+    limiter = _limiters.get(per_second)
+    if limiter is None:
+        limiter = _limiters[per_second] = RateLimiter(per_second)
+    return limiter
+
+
+async def fetch_trades_since(session, limiter, market, since_tms, count=500, max_pages=20, url=TRADES_URL):
+    """since_tms 이후(같은 ms 포함)의 체결을 최신순으로 페이지를 넘기며 조회 (Trade 목록)"""
+    trades = []
+    cursor = None
+    pages = 0
+    throttled = 0
+    while pages < max_pages:
+        params = {'market': market, 'count': count}
+        if cursor is not None:
+            params['cursor'] = cursor
+        await limiter.wait()
+        async with session.get(url, params=params) as response:
+            if response.status == 429 and throttled < max_pages:
+                # 요청 제한에 걸리면 잠시 쉬고 같은 페이지를 다시 요청 (페이지 수에는 세지 않음)
+                throttled += 1
+                await asyncio.sleep(1)
+                continue
+            response.raise_for_status()
+            page = await response.json()
+        pages += 1
+        if not page:
+            break
+        for tick in page:
+            # 같은 ms에 마지막으로 받은 체결 뒤의 체결이 있을 수 있으므로 같은 ms까지 받고, 겹치는 체결은 sid로 거름
+            if tick['timestamp'] < since_tms:
+                return trades
+            trades.append(Trade(market, tick['timestamp'], float(tick['trade_price']),
+                                float(tick['trade_volume']), tick['ask_bid'], tick['sequential_id']))
+        if len(page) < count:
+            break
+        cursor = page[-1]['sequential_id']
+    return trades
+
+
+async def backfill_pending(tracker, put, requests_per_second=8, label="main", url=TRADES_URL, retain_seconds=None):
+    """밀린 구간이 없어질 때까지 백필을 차례로 실행 (백필 중에 다시 끊기면 그 구간을 이어서 채움)"""
+    added = 0
+    while True:
+        gap = tracker.take_pending_gap()
+        if not gap:
+            return added
+        added += await backfill(tracker, gap, put, requests_per_second, label=label, url=url,
+                                retain_seconds=retain_seconds)
+
+
+async def backfill(tracker, gap, put, requests_per_second=8, label="main", url=TRADES_URL, retain_seconds=None):
+    """
+    끊긴 구간의 체결을 마켓별로 동시에 조회해, 중복을 걸러낸 뒤 put으로 큐에 넣음
+    retain_seconds: 집계기가 닫힌 봉을 보존하는 시간, 넣을 때 이보다 오래된 체결은 집계기가 버리므로 따로 세어 출력
+    """
+    if not gap:
+        return 0
+    started = time.monotonic()
+    limiter = shared_limiter(requests_per_second)
+    counts = {'added': 0, 'failed': 0, 'expired': 0}
+
+    async def fill(session, market, since_tms):
+        try:
+            trades = await fetch_trades_since(session, limiter, market, since_tms, url=url)
+        except Exception as e:
+            print(f"[{label}] Backfill failed for {market}: {e}")
+            counts['failed'] += 1
+            return
+        # 오래된 체결부터 넣어야 버킷의 시가/종가가 자연스럽게 유지됨
+        expire_before = int(time.time() * 1000) - retain_seconds * 1000 if retain_seconds else None
+        for trade in reversed(trades):
+            if tracker.seen(trade):
+                put(trade)
+                counts['added'] += 1
+                if expire_before is not None and trade.tms < expire_before:
+                    counts['expired'] += 1
+
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        await asyncio.gather(*(fill(session, market, since_tms) for market, since_tms in gap))
+
+    tracker.backfilled += counts['added']
+    print(f"[{label}] Backfilled {counts['added']} trades for {len(gap)} markets "
+          f"in {time.monotonic() - started:.1f}s (failed markets: {counts['failed']}, "
+          f"duplicates: {tracker.duplicates}, dropped as older than {retain_seconds}s retention: {counts['expired']})")
+    return counts['added']
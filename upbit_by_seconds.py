@@ -13,29 +13,19 @@ Created on Mon Jan  6 23:02:15 2025
 """
 # 모든 키 조회
 
-import os
-import yaml
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
 
-import redis
-import requests
 import pymysql
-import pandas as pd
-
-
+import redis
 
-def get_krw_markets():
-    """업비트 KRW 마켓의 모든 거래쌍 조회"""
-    url = "https://api.upbit.com/v1/market/all"
-    response = requests.get(url)
-    markets = response.json()
-    # KRW 마켓만 필터링
-    krw_markets = [market['market'] for market in markets if market['market'].startswith('KRW-')]
-    print(f"Total KRW markets: {len(krw_markets)}")
-    
-    return krw_markets
+from db_pool import DatabasePool, load_db_settings
+from bulk_writer import BulkWriter
+from market_info import MarketInfoCache
+from gecko_prices import GeckoPriceRefresher
+from ingest_metrics import METRICS
+from tick_scheduler import SKEW_WARN_THRESHOLD, format_bucket
 
 
 def connect_redis():
@@ -56,192 +46,165 @@ def connect_redis():
         raise
 
 
-
-
-def get_current_prices(markets, formatted_time):
-    url = "https://api.upbit.com/v1/ticker"
-    try:
-        # 최적화 포인트 1: 직접 join으로 markets 처리
-        response = requests.get(url, params={"markets": ",".join(markets)})
-        price_data = response.json()
-                
-        # 최적화 포인트 2: Dictionary Comprehension 사용
-        return {
-            ticker['market']: {formatted_time: ticker['trade_price']} 
-            for ticker in price_data
-        }
-    except Exception as e:
-        print(f"Error fetching prices: {e}")
-        return {}
-
-# def get_current_time(current_time):   
-    
-#     if current_time.minute == 0:
-#         # 0분일 때는 한 시간 전으로 가고 59분으로 설정
-#         rounded_time = current_time.replace(hour=current_time.hour - 1, minute=59, second=0, microsecond=0)
-#         # 만약 0시인 경우 이전 날 23시로 설정
-#         if rounded_time.hour < 0:
-#             rounded_time = rounded_time.replace(hour=23)
-#     else:
-#         # 그 외의 경우는 현재 분에서 1을 빼기
-#         rounded_minutes = current_time.minute - 1
-#         rounded_time = current_time.replace(minute=rounded_minutes, second=0, microsecond=0)
-    
-#     formatted_time = rounded_time.strftime('%Y-%m-%d %H:%M:%S')
-#     return formatted_time
-   
-def get_current_time(current_time):
-    # 현재 시간을 10초 단위로 내림
-    
-    rounded_seconds = (current_time.second // 10) * 10
-    rounded_time = current_time.replace(second=rounded_seconds, microsecond=0)- timedelta(seconds=10)
-    formatted_time = rounded_time.strftime('%Y-%m-%d %H:%M:%S')
-    return formatted_time
 #%%
 
 
 
-def wait_until_next_interval():
-    """
-    다음 10초 구간의 시작까지 대기
-    ex) 현재 23초면 30초가 될 때까지 대기
-    """
-    now = datetime.now()
-    next_interval = now + timedelta(seconds=10 - now.second % 10)
-    next_interval = next_interval.replace(microsecond=0)
-    sleep_seconds = (next_interval - now).total_seconds()
-    if sleep_seconds > 0:
-        time.sleep(sleep_seconds)
+# 웹소켓 집계기가 10초 봉을 닫을 때마다 보내는 스트림 (KEYS 스캔 없이 push로 받음)
+STREAM = 'trade_stats_stream'
+GROUP = 'upbit_by_seconds'
+CONSUMER = 'flusher'   # 재시작해도 같은 이름이어야 ack하지 못한 엔트리를 다시 받음
+PART_TIMEOUT = 5       # 일부 샤드의 part가 오지 않을 때 기다리는 최대 시간(초)
+RETRYABLE_DB_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError)   # 연결 끊김/타임아웃/데드락 등
+BUCKET_MS = 10_000     # 봉 길이(ms), 집계기는 체결이 없어도 봉마다 엔트리를 보내므로 ts 간격이 이보다 크면 빠진 봉
 
-#1. markets데이터 불러옴
-markets = get_krw_markets()
 
-
-r = connect_redis()
-gecko_price_dic = dict()
-while True:
+def ensure_group(r):
+    """소비자 그룹 생성 (이미 있으면 그대로 사용)"""
     try:
+        r.xgroup_create(STREAM, GROUP, id='0', mkstream=True)
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
 
-        wait_until_next_interval()
-        formatted_time = get_current_time(datetime.now())
-
-        keys = r.keys("trade_volume:*")
 
-        price_dic = get_current_prices(markets,formatted_time)
-        
-        # 해시 구조에 맞게 볼륨 추출 로직 수정
-        volume_dic = dict()
-        for key in keys:
-            # 키 구조가 "trade_volume:타임스탬프" 형식
-            _, timestamp_ms = key.split(":")
-            timestamp_ms = int(timestamp_ms)
-            dt = datetime.fromtimestamp(timestamp_ms/1000)
-            new_formatted_time = dt.strftime('%Y-%m-%d %H:%M:%S')
+def insert_bucket(formatted_time, stats_dic, replace=False):
+    """
+    10초 봉 하나를 tb_market에 기록 (replace면 같은 봉/마켓의 기존 행을 지우고 같은 트랜잭션에서 다시 넣음)
+    커밋했으면 True, 연결 오류처럼 다시 시도하면 될 오류면 False, 그 밖의 오류(제약 위반, 잘못된 값 등)는 그대로 올림
+    """
+    started = time.perf_counter()
+    try:
+        # 풀의 연결을 재사용 (주기마다 설정 파일을 읽고 새로 연결하지 않음), 오류가 나면 풀이 롤백함
+        with db_pool.get_connection() as connection:
+            wait_ms = (time.perf_counter() - started) * 1000
+            with connection.cursor() as cursor:
             
-            if new_formatted_time == formatted_time:
-                # 해당 타임스탬프의 모든 마켓 볼륨 가져오기
-                market_volumes = r.hgetall(key)
-                
-                for market, volume in market_volumes.items():
-                    volume_dic[market] = {formatted_time: volume}
-
-
-
-        #%%
-        file_path = "/home/ubuntu/baseball_project/db_settings.yml"  # YAML 파일이 있는 폴더 경로
-        with open(file_path, 'r', encoding = 'utf-8') as file:
-            yaml_data = yaml.safe_load(file)
-            yaml_data = yaml_data['BASEBALL']
+                # 마켓 메타데이터는 캐시 사용 (TTL마다 테이블이 바뀌었을 때만 다시 읽음)
+                market_info.refresh(connection)
             
-        connection = pymysql.connect(
-        host=yaml_data['HOST'],
-        user=yaml_data['USER'],
-        password=yaml_data['PASSWORD'],
-        db= 'upbit'
-        )
-
-        try:
-            with connection.cursor() as cursor:
-                
-                sql = """
-                SELECT * FROM tb_market_info
-                """
+                if replace and stats_dic:
+                    # tb_market에 (log_dt, market) 유일 키가 있다고 가정할 수 없으므로 ON DUPLICATE KEY UPDATE 대신 지우고 넣음
+                    cursor.execute(f"DELETE FROM tb_market WHERE log_dt = %s AND market IN "
+                                   f"({', '.join(['%s'] * len(stats_dic))})", (formatted_time, *stats_dic))
+            
+                total_list = list()
+                # 봉에 들어 있는 마켓만 기록: 집계기가 상장 마켓마다 봉을 채우고(체결이 없으면 직전 종가, 거래량 0)
+                # 상장 폐지된 마켓은 빼므로, 시작할 때 받은 목록 대신 봉 자체가 현재 마켓 목록이 됨
+                for market in sorted(stats_dic):
+                    stats = stats_dic[market]
+                    price = float(stats['close']) if stats['close'] is not None else None
+                    volume = float(stats['volume'])
+                    amount = float(stats['amount'])
+                    # 해외 가격은 백그라운드 갱신기의 캐시에서만 읽음 (네트워크 대기 없음)
+                    foreigner_price = gecko_prices.price(market_info.gecko_id(market))
                 
-                cursor.execute(sql)
-                market_info_data = pd.DataFrame(cursor.fetchall())
+                    values = (formatted_time, market, price, volume, amount, foreigner_price)
                 
-                cursor.execute("SHOW COLUMNS FROM tb_market_info")
-
+                    total_list.append(values)
+            
+            
+                market_writer.write(cursor, total_list)
+            connection.commit()
+            
+            print(f"[{datetime.now()}, {formatted_time}]: Successfully inserted {len(total_list)} records "
+                  f"(db connection {wait_ms:.1f}ms, total {(time.perf_counter() - started) * 1000:.1f}ms)")
+            return True
+    except RETRYABLE_DB_ERRORS as e:
+        print(f"Insert error (will retry): {e}")
+        return False
 
-                market_info_columns = cursor.fetchall()
-                market_info_columns =  [row[0] for row in market_info_columns]
 
-                market_info_data.columns = market_info_columns
-                
-                
-                try:
-                    gecko_id_list = list(market_info_data.gecko_id)
-                    gecko_ids = ','.join(gecko_id_list)
-                   
-                    gecko_url = "https://api.coingecko.com/api/v3/simple/price"
-                    gecko_params = {
-                        'ids': gecko_ids,  # "bitcoin,ethereum" 형태로 전달
-                        'vs_currencies': 'krw'
-                    }
-    
-                    gecko_response = requests.get(gecko_url,params = gecko_params)
-                    if gecko_response.status_code == 200:
-                        gecko_price_dic = gecko_response.json()
+def write_bucket(ts, stats_dic, entry_ids, replace=False):
+    """
+    봉 하나를 기록하고 ack해도 되면 True (다시 시도해야 하면 False)
+    다시 시도해도 같은 오류가 날 봉은 막혀 있지 않도록 내용을 로그에 남기고 건너뜀
+    """
+    formatted_time = datetime.fromtimestamp(ts / 1000).strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        return insert_bucket(formatted_time, stats_dic, replace)
+    except Exception as e:
+        skipped_counter.inc()
+        print(f"[{formatted_time}] Skipping bucket after error: {e!r} "
+              f"(entries {entry_ids[0]}..{entry_ids[-1]}, data {json.dumps(stats_dic)})")
+        return True
 
-                except Exception as e:
-                    
-                    print(f"Error: {e}")
 
-                
-                
-                
-                total_list = list()
-                for market in markets:
-                    
-                    
-                    try:
-                        volume = float(volume_dic[market][formatted_time])
-                    except:
-                        volume = None
-                    try:
-                        price = price_dic[market][formatted_time]
-                        print(price)
-                        price = float(price)
-                    except:
-                        price = None
-                    try:
-                        amount = volume * price   
-                    except:
-                        amount = None
-                    try:
-                        gecko_id = market_info_data[market_info_data['market'] == market]['gecko_id'].iloc[0]
-                        foreigner_price = gecko_price_dic[gecko_id]['krw']
-                    except Exception as e:
-                        foreigner_price = None
-                    
-                    values = (formatted_time, market, price, volume, amount, foreigner_price)
-                    
-                    total_list.append(values)
-                
-                
-                sql = """
-                    INSERT INTO tb_market
-                    (log_dt, market, price, volume, amount, price_foreign) 
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    """
-                
-                cursor.executemany(sql, total_list)
-                connection.commit()
-                
-                print(f"[{datetime.now()}, {formatted_time}]: Successfully inserted {len(total_list)} records")
-        except Exception as e:
-            print(f"Error: {e}")
-            connection.rollback()
+r = connect_redis()
+ensure_group(r)
+market_writer = BulkWriter('tb_market', ('log_dt', 'market', 'price', 'volume', 'amount', 'price_foreign'))
+db_pool = DatabasePool(load_db_settings(), db='upbit', pool_size=1, local_infile=market_writer.local_infile)
+market_info = MarketInfoCache()
+with db_pool.get_connection() as connection:
+    market_info.refresh(connection)
+gecko_prices = GeckoPriceRefresher(market_info.gecko_ids).start()
+buckets = dict()      # ts -> {'ids': 엔트리 ID 목록, 'parts': 받은 part 이름, 'expected': 전체 part 수, 'data': 마켓별 통계,
+                      #        'redelivered': 재시작 후 다시 받은 엔트리 포함 (커밋 후 ack 전에 멈췄을 수 있음)}
+rewrites = dict()     # 이미 기록한 봉에 대해 받은 엔트리(다시 보낸 봉, PART_TIMEOUT 뒤에 온 part): ts -> {'ids', 'data'}
+last_id = '0'         # '0': 시작하면 ack하지 못한(pending) 엔트리부터 다시 읽음, 다 읽으면 '>'
+done_until = -1       # 마지막으로 기록한 봉
+# 이 스크립트는 타이머 대신 스트림으로 틱을 받으므로, 봉이 닫힌 뒤 기록을 시작하기까지의 지연을 skew로 기록
+skew_histogram = METRICS.histogram('tick_start_skew_seconds', "Delay between scheduled and actual tick start",
+                                   job='upbit_by_seconds')
+missed_counter = METRICS.counter('ticks_missed_total', "Ticks skipped because the loop fell behind",
+                                 job='upbit_by_seconds')
+skipped_counter = METRICS.counter('buckets_skipped_total', "Buckets dropped after a non-retryable write error",
+                                  job='upbit_by_seconds')
+while True:
+    try:
+        response = r.xreadgroup(GROUP, CONSUMER, {STREAM: last_id}, count=100, block=1000)
+        entries = response[0][1] if response else []
+        redelivered = last_id != '>'
+        if redelivered:
+            last_id = entries[-1][0] if entries else '>'
+
+        for entry_id, fields in entries:
+            ts = int(fields['ts'])
+            if ts <= done_until:
+                # 이미 기록한 봉(늦은 체결/백필로 다시 보낸 봉, PART_TIMEOUT 뒤에 온 part): 이 엔트리에 담긴 마켓만 다시 기록
+                # (같은 봉의 엔트리는 나중 것이 최신)
+                rewrite = rewrites.setdefault(ts, {'ids': [], 'data': dict()})
+                rewrite['ids'].append(entry_id)
+                rewrite['data'].update(json.loads(fields['data']))
+                continue
+            bucket = buckets.setdefault(ts, {'ids': [], 'parts': set(), 'expected': int(fields['parts']),
+                                             'data': dict(), 'first_seen': time.monotonic(),
+                                             'redelivered': False})
+            bucket['ids'].append(entry_id)
+            bucket['parts'].add(fields['part'])
+            bucket['data'].update(json.loads(fields['data']))
+            bucket['redelivered'] |= redelivered
+
+        # 오래된 봉부터, 모든 part가 모였거나 PART_TIMEOUT이 지난 봉을 기록하고 커밋 후 ack
+        for ts in sorted(buckets):
+            bucket = buckets[ts]
+            if (len(bucket['parts']) < bucket['expected']
+                    and time.monotonic() - bucket['first_seen'] < PART_TIMEOUT):
+                break
+            formatted_time = datetime.fromtimestamp(ts / 1000).strftime('%Y-%m-%d %H:%M:%S')
+            skew = max(time.time() - (ts + BUCKET_MS) / 1000, 0.0)
+            if not write_bucket(ts, bucket['data'], bucket['ids'], replace=bucket['redelivered']):
+                # ack하지 않고 남겨 두었다가 다음 루프에서 다시 시도
+                break
+            # 기록에 성공한 봉만 집계 (재시도한 봉을 두 번 세지 않음)
+            skew_histogram.record(skew * 1e6)
+            if skew >= SKEW_WARN_THRESHOLD:
+                print(f"[{formatted_time}] flush started {skew:.2f}s after the bucket closed")
+            if done_until >= 0 and ts - done_until > BUCKET_MS:
+                missed = (ts - done_until) // BUCKET_MS - 1
+                missed_counter.inc(missed)
+                print(f"missed {missed} bucket(s) ({format_bucket(done_until // BUCKET_MS + 1, BUCKET_MS // 1000)} ~ "
+                      f"{format_bucket(ts // BUCKET_MS - 1, BUCKET_MS // 1000)})")
+            r.xack(STREAM, GROUP, *bucket['ids'])
+            del buckets[ts]
+            done_until = ts
+
+        for ts in sorted(rewrites):
+            rewrite = rewrites[ts]
+            if not write_bucket(ts, rewrite['data'], rewrite['ids'], replace=True):
+                break
+            r.xack(STREAM, GROUP, *rewrite['ids'])
+            del rewrites[ts]
     except Exception as e:
         print(f"Main loop error: {e}")
 
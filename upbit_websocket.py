@@ -1,22 +1,48 @@
 import requests
 import redis
+import redis.asyncio
 import websockets
-import json
 import asyncio
-from datetime import datetime
-from asyncio import Queue
+import time
+import os
+import zlib
+import math
+import random
+import multiprocessing
+import platform
 import orjson
 
-def get_krw_markets():
+from trade_aggregator import CandleEngine, TradeBucket
+from ingest_queue import make_ingest_queue
+from trade_backfill import TradeTracker, backfill_pending
+from frame_journal import FrameJournal
+from ws_decoder import decode_trade, Trade
+from ingest_metrics import METRICS, CommitLatency, serve_metrics
+from trade_ring import TradeRing, supported as ring_supported
+import loop_runner
+
+def get_krw_markets(rest_url="https://api.upbit.com/v1"):
    """업비트 KRW 마켓의 모든 거래쌍 조회"""
-   url = "https://api.upbit.com/v1/market/all"
-   response = requests.get(url)
+   url = f"{rest_url}/market/all"
+   response = requests.get(url, timeout=10)
    markets = response.json()
    # KRW 마켓만 필터링
    krw_markets = [market['market'] for market in markets if market['market'].startswith('KRW-')]
    print(f"Total KRW markets: {len(krw_markets)}")
    return krw_markets
 
+def get_ticker_prices(markets, rest_url="https://api.upbit.com/v1", chunk_size=100):
+   """시작 시점의 현재가 조회 (체결 전 마켓의 빈 봉을 채우기 위한 초기값, 1회만 호출)"""
+   prices = dict()
+   try:
+       for i in range(0, len(markets), chunk_size):
+           response = requests.get(f"{rest_url}/ticker",
+                                   params={"markets": ",".join(markets[i:i + chunk_size])}, timeout=5)
+           prices.update({ticker['market']: ticker['trade_price'] for ticker in response.json()})
+   except Exception as e:
+       print(f"Error fetching prices: {e}")
+   return prices
+
 def connect_redis():
    try:
        r = redis.Redis(
@@ -34,70 +60,672 @@ def connect_redis():
        print("Please make sure Redis server is running")
        raise
 
-krw_markets = get_krw_markets()
-try:
-   r = connect_redis()
-except Exception as e:
-   print(f"Redis connection failed: {e}")
+def connect_redis_async():
+   """asyncio Redis 클라이언트 (연결 풀 사용, 연결은 호출한 이벤트 루프에서 필요할 때 생성)"""
+   pool = redis.asyncio.ConnectionPool(
+       host='localhost',
+       port=6379,
+       db=0,
+       decode_responses=True,
+       socket_connect_timeout=5,
+       max_connections=REDIS_POOL_SIZE
+   )
+   return redis.asyncio.Redis(connection_pool=pool)
+
+def get_async_redis():
+   """이 프로세스의 asyncio Redis 클라이언트 (처음 호출할 때 생성)"""
+   global ra
+   if ra is None:
+       ra = connect_redis_async()
+   return ra
+
+UPBIT_WS_URI = "wss://api.upbit.com/websocket/v1"
+UPBIT_REST_URL = "https://api.upbit.com/v1"
+krw_markets = []  # main()에서 조회
+r = None          # main()에서 연결
+ra = None         # asyncio Redis 클라이언트 (이벤트 루프 안에서 생성)
+metrics_slot = 0       # /metrics 포트 = METRICS_PORT + metrics_slot (프로세스마다 다름)
+metrics_server = None  # 프로세스당 하나
+
+BUCKET_CLOSE_GRACE = 500     # 버킷 종료 후 늦은 체결을 기다리는 시간(ms)
+CLOSE_CHECK_INTERVAL = 0.2   # 닫을 버킷 확인 주기(초)
+BATCH_MAX_MESSAGES = 1000    # 한 번에 큐에서 꺼낼 최대 메시지 수
+BATCH_MAX_WAIT = 0.05        # 배치를 채우기 위해 기다리는 최대 시간(초)
+STATS_INTERVAL = 10          # 처리량 통계 출력 주기(초)
+REDIS_CLIENT = 'async'       # 'async': redis.asyncio 연결 풀 / 'sync': 기존 redis.Redis (이벤트 루프를 막음)
+REDIS_POOL_SIZE = 10         # asyncio Redis 연결 풀 크기
+MARKET_REFRESH_INTERVAL = 300  # 마켓 목록 재조회 주기(초), 신규 상장/상장 폐지를 연결을 끊지 않고 반영
+SHARD_CONNECTIONS = 1        # 웹소켓 연결(샤드) 수, 1이면 단일 연결 모드
+SHARD_PROCESSES = 1          # 샤드를 나눠 실행할 워커 프로세스 수
+QUEUE_MAXSIZE = 10000        # 수신 큐 크기
+QUEUE_POLICY = 'coalesce'    # 큐가 가득 찰 때의 정책: drop_oldest / coalesce / spill
+BACKFILL_ON_RECONNECT = True # 재연결 시 끊긴 동안의 체결을 REST로 채움
+BACKFILL_REQUESTS_PER_SECOND = 8  # 백필 REST 요청 한도 (시세 API 초당 10회 안쪽), 프로세스 안의 연결이 함께 쓰고 샤드 프로세스 수로 나눔
+SPILL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spill')
+JOURNAL_DIR = None           # 원본 프레임 기록 경로 (None이면 기록하지 않음), 샤드별 하위 폴더 사용
+CONSUMER_WORKERS = 1         # 연결당 처리 워커 수 (마켓 해시로 분배, 워커마다 큐/집계기를 따로 가짐)
+CONSUMER_PROCESSES = False   # True면 처리 워커를 별도 프로세스로 실행 (여러 코어 사용)
+HANDOFF_INTERVAL = 0.01      # 워커 프로세스로 체결을 묶어서 넘기는 주기(초)
+CONSUMER_HANDOFF = 'queue'   # 워커 프로세스로 넘기는 방식: 'queue' (튜플 묶음을 multiprocessing 큐로) / 'ring' (공유 메모리 링 버퍼)
+                             # 'ring'은 x86에서만, 수신 프로세스가 CPU를 다 쓸 때만 이득 (trade_ring.py 참고)
+RING_CAPACITY = 1 << 16      # 처리 워커당 링 버퍼 레코드 수 (레코드당 64바이트)
+RING_POLL_INTERVAL = 0.001   # 링 버퍼가 비어 있을 때 다시 확인하는 주기(초)
+APP_PING_INTERVAL = 1.0      # 애플리케이션 "PING" 전송 주기(초), 서버는 {"status":"UP"}으로 응답
+RECV_IDLE_TIMEOUT = 3.0      # 이 시간 동안 어떤 프레임도 없으면 멈춘 연결로 보고 재연결(초)
+WS_PING_INTERVAL = 5         # 웹소켓 프로토콜 ping 주기(초)
+WS_PING_TIMEOUT = 5          # 프로토콜 pong 대기 시간(초)
+WS_CLOSE_TIMEOUT = 1         # 멈춘 연결을 닫을 때 종료 핸드셰이크를 기다리는 시간(초)
+RECONNECT_BASE_DELAY = 0.5   # 재연결 대기 시간의 시작값(초), 실패할 때마다 2배
+RECONNECT_MAX_DELAY = 30     # 재연결 대기 시간 상한(초)
+METRICS_PORT = 9108          # Prometheus /metrics 포트 (None이면 끄기), 샤드/처리 워커 프로세스는 +1, +2, ...
+
+class SinkStats:
+   """Redis 싱크 처리량 통계 (messages/sec, redis calls/sec)와 처리 워커의 단계별 지연 히스토그램"""
+   def __init__(self, label="main"):
+       self.label = label
+       self.receive_to_dequeue = METRICS.histogram(
+           'ingest_receive_to_dequeue_seconds', "웹소켓 수신 -> 처리 워커가 큐에서 꺼냄", worker=label)
+       self.commit = CommitLatency(METRICS.histogram(
+           'ingest_dequeue_to_commit_seconds', "큐에서 꺼냄 -> 그 체결의 1초봉이 Redis에 기록 완료", worker=label))
+       self.messages = 0
+       self.redis_calls = 0
+       self.batches = 0
+       self.last_report = time.monotonic()
+
+   def record_messages(self, messages):
+       self.messages += messages
+
+   def record_flush(self, redis_calls):
+       self.redis_calls += redis_calls
+       self.batches += 1
 
-async def process_data(queue):
+   def report_if_due(self, queue, aggregator):
+       now = time.monotonic()
+       elapsed = now - self.last_report
+       if elapsed < STATS_INTERVAL:
+           return
+       print(f"[{self.label}] {self.messages/elapsed:.1f} msgs/s, "
+             f"{self.redis_calls/elapsed:.1f} redis commands/s, "
+             f"{self.batches/elapsed:.1f} pipelines/s, queue={queue.qsize()} ({queue.stats_text()}), "
+             f"open buckets={len(aggregator.open_buckets)}, "
+             f"late={aggregator.late_trades}, dropped={aggregator.dropped_trades}")
+       self.messages = 0
+       self.redis_calls = 0
+       self.batches = 0
+       self.last_report = now
+
+async def drain_batch(queue, max_messages=BATCH_MAX_MESSAGES, max_wait=BATCH_MAX_WAIT):
+   """큐에 쌓인 메시지를 최대 max_messages개 또는 max_wait초까지 모아서 반환"""
+   batch = [await queue.get()]
+   loop = asyncio.get_running_loop()
+   deadline = loop.time() + max_wait
+   while len(batch) < max_messages:
+       try:
+           batch.append(queue.get_nowait())
+           continue
+       except asyncio.QueueEmpty:
+           pass
+       remaining = deadline - loop.time()
+       if remaining <= 0:
+           break
+       try:
+           batch.append(await asyncio.wait_for(queue.get(), remaining))
+       except asyncio.TimeoutError:
+           break
+   return batch
+
+async def process_data(queue, aggregator, stats):
+   """큐의 체결을 메모리 봉(1s/10s/1m)에 반영 (Redis 기록은 bucket_closer 담당)"""
    while True:
        try:
-           data = await queue.get()
-           
-           TEN_SECONDS = 10000
-           base_timestamp = data['tms'] - (data['tms'] % TEN_SECONDS)
-           key = f"trade_volume:{base_timestamp}"
-           
-           try:
-               r.hincrbyfloat(key, data['cd'], float(data['tv']))
-               r.expire(key, 60)
-           except redis.RedisError as e:
-               print(f"Redis operation failed: {e}")
-           
-           queue.task_done()
+           batch = await drain_batch(queue)
+           now_ns = time.time_ns()
+           for item in batch:
+               if item.rts:
+                   stats.receive_to_dequeue.record((now_ns - item.rts) // 1000)
+               if type(item) is TradeBucket:
+                   # coalesce 정책에서 큐에 있는 동안 합쳐진 체결
+                   aggregator.merge(item)
+                   stats.commit.dequeued(item.base_timestamp, now_ns, item.count)
+               else:
+                   aggregator.add(item)
+                   stats.commit.dequeued(item.tms, now_ns)
+               queue.task_done()
+           stats.record_messages(len(batch))
        except Exception as e:
            print(f"Error processing data: {e}")
 
-async def upbit_ws_client():
-   uri = "wss://api.upbit.com/websocket/v1"
-   queue = Queue(maxsize=10000)
-   
-   # 처리 태스크 시작
-   process_task = asyncio.create_task(process_data(queue))
+async def bucket_closer(queue, aggregator, stats):
+   """
+   닫힌 봉을 주기적으로 Redis에 기록 (주기/버킷당 마켓 전체를 한 번에)
+   asyncio 클라이언트를 쓰면 기록을 기다리는 동안에도 수신/처리 태스크가 계속 돈다.
+   같은 버킷의 재기록 순서가 뒤바뀌지 않도록 샤드당 기록은 한 번에 하나씩만 보낸다.
+   """
+   if REDIS_CLIENT == 'async':
+       get_async_redis()
+   while True:
+       await asyncio.sleep(CLOSE_CHECK_INTERVAL)
+       try:
+           now_ms = int(time.time() * 1000)
+           if REDIS_CLIENT == 'async':
+               buckets, redis_calls = await aggregator.flush_async(ra, now_ms)
+           else:
+               buckets, redis_calls = aggregator.flush(r, now_ms)
+           stats.commit.committed(aggregator.closed_until(), time.time_ns())
+           if buckets:
+               stats.record_flush(redis_calls)
+       except redis.RedisError as e:
+           print(f"Redis operation failed: {e}")
+       except Exception as e:
+           print(f"Error closing buckets: {e}")
+       stats.report_if_due(queue, aggregator)
+
+def shard_of(market, shard_count):
+   """마켓 코드의 안정적인 해시(crc32)로 샤드 번호 결정 (프로세스/재시작과 무관하게 동일)"""
+   return zlib.crc32(market.encode()) % shard_count
+
+def split_markets(markets, shard_count):
+   """마켓 목록을 shard_count개의 샤드로 분할"""
+   shards = [[] for _ in range(shard_count)]
+   for market in markets:
+       shards[shard_of(market, shard_count)].append(market)
+   return shards
+
+def worker_of(market, workers, shard_count=None):
+   """
+   샤드 안에서 처리 워커 번호 결정
+   샤드와 같은 crc32 % N을 쓰면 샤드 수와 워커 수가 공약수를 가질 때 한 샤드의 마켓이 모두 같은 워커로 몰리므로,
+   샤드 번호에 쓰인 나머지를 버린 몫(crc32 // 샤드 수)으로 나눔
+   """
+   shard_count = max(SHARD_CONNECTIONS if shard_count is None else shard_count, 1)
+   return (zlib.crc32(market.encode()) // shard_count) % workers
+
+def split_workers(label, markets, workers):
+   """샤드의 마켓 목록을 처리 워커 수만큼 분할 (마켓이 하나도 없는 워커가 있으면 출력)"""
+   groups = [[] for _ in range(workers)]
+   for market in markets:
+       groups[worker_of(market, workers)].append(market)
+   idle = [index for index, group in enumerate(groups) if not group]
+   if idle and len(markets) >= workers:
+       print(f"[{label}] consumer workers {idle} have no markets ({[len(group) for group in groups]})")
+   return groups
+
+def late_trade_ttl(market_count):
+   """
+   닫힌 봉을 늦은 체결/백필용으로 메모리에 남겨 둘 시간(초)
+   끊김 감지(RECV_IDLE_TIMEOUT) + 재연결 대기 상한(RECONNECT_MAX_DELAY) + 백필(마켓마다 요청 1회 이상)의 두 배
+   예) KRW 마켓 250개, 초당 8회: 2 * (3 + 30 + 31.25) = 129초 (기본 ttl 60초로는 30초 넘게 끊기면 백필한 체결을 버림)
+   """
+   backfill_seconds = market_count / BACKFILL_REQUESTS_PER_SECOND
+   return math.ceil(2 * (RECV_IDLE_TIMEOUT + RECONNECT_MAX_DELAY + backfill_seconds))
+
+def make_consumer(label, markets, seed, key_prefix='', ttl=None):
+   """처리 워커 하나의 수신 큐/캔들 엔진/통계 생성 (시작 가격은 담당 마켓 것만, ttl: 닫힌 봉 보존 시간 하한)"""
+   queue = make_ingest_queue(QUEUE_POLICY, QUEUE_MAXSIZE,
+                             spill_path=os.path.join(SPILL_DIR, f"{label}.jsonl"))
+   # 1s/10s/1m 봉을 동시에 생성 (10초 봉은 trade_volume/trade_stats 키)
+   # 10초 봉 스트림 엔트리는 (연결 수 x 처리 워커 수)개 part로 나뉘어 감
+   aggregator = CandleEngine(grace_ms=BUCKET_CLOSE_GRACE, key_prefix=key_prefix, stream_part=label,
+                             stream_parts=max(SHARD_CONNECTIONS, 1) * CONSUMER_WORKERS, min_ttl=ttl)
+   markets = set(markets)
+   aggregator.seed_prices({market: price for market, price in seed.items() if market in markets})
+
+   METRICS.gauge('ingest_queue_depth', "처리 워커 수신 큐 길이", queue.qsize, worker=label)
+   for name in queue.stats:
+       METRICS.gauge(f'ingest_queue_{name}_total', f"수신 큐 {name} 카운터",
+                     lambda name=name: queue.stats[name], kind='counter', worker=label)
+   METRICS.gauge('candle_open_buckets', "열려 있는 10초 버킷 수", lambda: len(aggregator.open_buckets), worker=label)
+   METRICS.gauge('candle_late_trades_total', "이미 닫힌 버킷에 늦게 도착한 체결 수",
+                 lambda: aggregator.late_trades, kind='counter', worker=label)
+   return queue, aggregator, SinkStats(label)
+
+async def run_consumer(queue, aggregator, stats):
+   await asyncio.gather(process_data(queue, aggregator, stats), bucket_closer(queue, aggregator, stats))
+
+def worker_labels(label, count):
+   return [label] if count == 1 else [f"{label}/w{i}" for i in range(count)]
+
+class ConsumerPool:
+   """
+   마켓 코드 해시로 체결을 N개 처리 워커(asyncio 태스크)에 분배
+   같은 마켓은 항상 같은 워커로 가므로 마켓별 처리 순서가 유지된다.
+   """
+   def __init__(self, label, markets, seed, key_prefix, workers, ttl=None):
+       self.count = workers
+       groups = split_workers(label, markets, workers)
+       self.consumers = [make_consumer(worker_label, group, seed, key_prefix, ttl)
+                         for worker_label, group in zip(worker_labels(label, workers), groups)]
+       self.queues = [queue for queue, _, _ in self.consumers]
+
+   def start(self):
+       return [asyncio.create_task(run_consumer(*consumer)) for consumer in self.consumers]
+
+   def put_nowait(self, trade):
+       self.queues[worker_of(trade.cd, self.count)].put_nowait(trade)
+
+   def update_markets(self, listed, delisted):
+       """상장/상장 폐지 이벤트를 담당 워커의 캔들 엔진에 전달 (listed: 마켓 -> 현재가)"""
+       for index, (_, aggregator, _) in enumerate(self.consumers):
+           aggregator.add_markets({m: p for m, p in listed.items() if worker_of(m, self.count) == index})
+           aggregator.remove_markets([m for m in delisted if worker_of(m, self.count) == index])
+
+class ProcessConsumerPool:
+   """
+   ConsumerPool과 같은 분배 규칙으로 처리 워커를 별도 프로세스에서 실행
+   체결은 워커별로 모아 HANDOFF_INTERVAL마다 튜플 묶음으로 multiprocessing 큐에 넘긴다.
+   """
+   def __init__(self, label, markets, seed, key_prefix, workers, first_metrics_slot, ttl=None):
+       self.count = workers
+       groups = split_workers(label, markets, workers)
+       self.args = [(worker_label, group, seed, key_prefix, ttl, first_metrics_slot + index)
+                    for index, (worker_label, group) in enumerate(zip(worker_labels(label, workers), groups))]
+       self.handoff = [multiprocessing.Queue() for _ in range(workers)]
+       self.pending = [[] for _ in range(workers)]
+       self.processes = [None] * workers
+
+   def _start_process(self, index):
+       process = multiprocessing.Process(target=run_consumer_process,
+                                         args=(*self.args[index], self.handoff[index]), daemon=True)
+       process.start()
+       self.processes[index] = process
+
+   def start(self):
+       for index in range(self.count):
+           self._start_process(index)
+       return [asyncio.create_task(self._handoff_loop())]
+
+   def put_nowait(self, trade):
+       self.pending[worker_of(trade.cd, self.count)].append(trade.to_tuple())
+
+   def update_markets(self, listed, delisted):
+       """상장/상장 폐지 이벤트를 체결과 같은 큐로 보내 순서를 유지 (재시작용 마켓 목록도 갱신)"""
+       for index in range(self.count):
+           group = self.args[index][1]
+           added = {m: p for m, p in listed.items() if worker_of(m, self.count) == index}
+           removed = [m for m in delisted if worker_of(m, self.count) == index]
+           if not added and not removed:
+               continue
+           group[:] = [m for m in group if m not in removed] + list(added)
+           if self.pending[index]:
+               self.handoff[index].put(self.pending[index])
+               self.pending[index] = []
+           self.handoff[index].put({'listed': added, 'delisted': removed})
+
+   async def _handoff_loop(self):
+       while True:
+           await asyncio.sleep(HANDOFF_INTERVAL)
+           for index, pending in enumerate(self.pending):
+               process = self.processes[index]
+               if not process.is_alive():
+                   # 죽은 워커는 같은 마켓 구성으로 다시 시작 (미기록 봉은 잃음)
+                   print(f"[{self.args[index][0]}] exited with {process.exitcode}, restarting")
+                   self._start_process(index)
+               if pending:
+                   self.handoff[index].put(pending)
+                   self.pending[index] = []
+
+class RingConsumerPool(ProcessConsumerPool):
+   """
+   ProcessConsumerPool과 같은 분배 규칙이지만 체결을 처리 워커별 공유 메모리 링 버퍼에 고정 크기 레코드로 씀
+   (pickle/큐 피더 스레드 없음). 링이 가득 차면 남은 체결은 다음 주기에 이어서 씀.
+   상장/상장 폐지 이벤트는 multiprocessing 큐로 보내되 링 위치(at)를 붙여 체결 사이 순서를 유지한다.
+   """
+   def __init__(self, label, markets, seed, key_prefix, workers, first_metrics_slot, ttl=None):
+       super().__init__(label, markets, seed, key_prefix, workers, first_metrics_slot, ttl)
+       self.rings = [TradeRing.create(RING_CAPACITY) for _ in range(workers)]
+       self.full = [METRICS.counter('ingest_ring_full_total', "링 버퍼가 가득 차 다음 주기로 미룬 횟수",
+                                    worker=args[0]) for args in self.args]
+
+   def _start_process(self, index):
+       process = multiprocessing.Process(target=run_consumer_process,
+                                         args=(*self.args[index], self.handoff[index], self.rings[index].name),
+                                         daemon=True)
+       process.start()
+       self.processes[index] = process
+
+   def put_nowait(self, trade):
+       self.pending[worker_of(trade.cd, self.count)].append(trade)
+
+   def update_markets(self, listed, delisted):
+       """상장/상장 폐지 이벤트를 체결과 같은 대기 목록에 넣어 순서를 유지 (재시작용 마켓 목록도 갱신)"""
+       for index in range(self.count):
+           group = self.args[index][1]
+           added = {m: p for m, p in listed.items() if worker_of(m, self.count) == index}
+           removed = [m for m in delisted if worker_of(m, self.count) == index]
+           if not added and not removed:
+               continue
+           group[:] = [m for m in group if m not in removed] + list(added)
+           self.pending[index].append({'listed': added, 'delisted': removed})
+
+   def _drain(self, index):
+       """대기 중인 체결/이벤트를 링이 받는 만큼 순서대로 넘김"""
+       ring = self.rings[index]
+       pending = self.pending[index]
+       done = 0
+       while done < len(pending):
+           if type(pending[done]) is dict:
+               self.handoff[index].put({**pending[done], 'at': ring.write_position})
+               done += 1
+               continue
+           written = ring.write_many(pending, done)
+           if written == 0:
+               self.full[index].inc()
+               break
+           done += written
+       del pending[:done]
+
+   async def _handoff_loop(self):
+       try:
+           while True:
+               await asyncio.sleep(HANDOFF_INTERVAL)
+               for index in range(self.count):
+                   process = self.processes[index]
+                   if not process.is_alive():
+                       # 링은 수신 프로세스가 가지고 있으므로 새 워커는 읽던 위치부터 이어서 읽음
+                       print(f"[{self.args[index][0]}] exited with {process.exitcode}, restarting")
+                       self._start_process(index)
+                   if self.pending[index]:
+                       self._drain(index)
+       finally:
+           for ring in self.rings:
+               ring.unlink()
+
+async def consume_ring(label, markets, seed, key_prefix, ttl, events, ring_name):
+   ring = TradeRing.attach(ring_name)
+   await start_metrics_endpoint()
+   queue, aggregator, stats = make_consumer(label, markets, seed, key_prefix, ttl)
+   consumer_task = asyncio.create_task(run_consumer(queue, aggregator, stats))
+   pending_events = []
+   while True:
+       while not events.empty():
+           pending_events.append(events.get())
+       limit = pending_events[0]['at'] if pending_events else None
+       trades = ring.read(BATCH_MAX_MESSAGES, limit)
+       for trade in trades:
+           queue.put_nowait(trade)
+       if pending_events and ring.read_position >= limit:
+           # 이벤트 이전 체결을 모두 넘긴 뒤 상장/상장 폐지 반영
+           event = pending_events.pop(0)
+           aggregator.add_markets(event['listed'])
+           aggregator.remove_markets(event['delisted'])
+           continue
+       # 읽은 것이 있으면 처리 태스크에 차례만 넘기고, 비어 있으면 잠시 기다림
+       await asyncio.sleep(0 if trades else RING_POLL_INTERVAL)
+
+async def consume_handoff(label, markets, seed, key_prefix, ttl, handoff):
+   await start_metrics_endpoint()
+   queue, aggregator, stats = make_consumer(label, markets, seed, key_prefix, ttl)
+   consumer_task = asyncio.create_task(run_consumer(queue, aggregator, stats))
+   loop = asyncio.get_running_loop()
+   while True:
+       batch = await loop.run_in_executor(None, handoff.get)
+       if type(batch) is dict:
+           # 상장/상장 폐지 이벤트
+           aggregator.add_markets(batch['listed'])
+           aggregator.remove_markets(batch['delisted'])
+           continue
+       for item in batch:
+           queue.put_nowait(Trade(*item))
+
+def run_consumer_process(label, markets, seed, key_prefix, ttl, slot, handoff, ring_name=None):
+   """처리 워커 프로세스 진입점 (ring_name이 있으면 공유 메모리 링 버퍼에서 체결을 읽음)"""
+   global r, ra, metrics_slot, metrics_server
+   # 부모 프로세스의 Redis 연결을 공유하지 않도록 새로 연결
+   r = connect_redis()
+   ra = None
+   # 부모에게서 복사된 메트릭은 버리고 이 프로세스의 포트로 따로 노출
+   METRICS.clear()
+   metrics_slot = slot
+   metrics_server = None
+   if ring_name is not None:
+       loop_runner.run(consume_ring(label, markets, seed, key_prefix, ttl, handoff, ring_name), name=label)
+   else:
+       loop_runner.run(consume_handoff(label, markets, seed, key_prefix, ttl, handoff), name=label)
+
+STATUS_FRAMES = (b'{"status"', '{"status"')
+
+async def start_metrics_endpoint():
+   """프로세스당 한 번 /metrics 엔드포인트 시작 (포트 = METRICS_PORT + metrics_slot)"""
+   global metrics_server
+   if METRICS_PORT is None or metrics_server is not None:
+       return
+   try:
+       metrics_server = await serve_metrics(METRICS_PORT + metrics_slot)
+   except OSError as e:
+       print(f"Metrics endpoint disabled: {e}")
+       metrics_server = False
+
+def reconnect_delay(attempt):
+   """지수 백오프 + full jitter (여러 연결이 동시에 끊겨도 재연결이 한꺼번에 몰리지 않도록)"""
+   return random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt))
+
+def subscribe_message(ticket, markets):
+   return orjson.dumps([
+       {"ticket": ticket},
+       {
+           "type": "trade",
+           "codes": markets,
+           "isOnlyRealtime": True
+       },
+       {"format": "SIMPLE"}
+   ])
+
+async def publish_market_events(key_prefix, listed, delisted):
+   """상장/상장 폐지 이벤트를 {key_prefix}market_events 스트림에 기록 (다른 소비자용)"""
+   client = get_async_redis() if REDIS_CLIENT == 'async' else r
+   pipe = client.pipeline(transaction=False)
+   now_ms = int(time.time() * 1000)
+   for event, markets in (('listed', listed), ('delisted', delisted)):
+       for market in markets:
+           pipe.xadd(f"{key_prefix}market_events", {'event': event, 'market': market, 'ts': now_ms},
+                     maxlen=10000, approximate=True)
+   if REDIS_CLIENT == 'async':
+       await pipe.execute()
+   else:
+       pipe.execute()
+
+async def refresh_markets(markets, shard_id, pool, connection, ticket, label, key_prefix, rest_url):
+   """
+   마켓 목록을 주기적으로 다시 조회해 바뀐 부분만 반영
+   markets는 제자리에서 바꾸므로 재연결할 때도 최신 목록으로 구독하고,
+   연결 중이면 같은 연결에 새 구독 메시지를 보낸다 (같은 ticket의 구독은 마지막 요청으로 대체됨).
+   """
+   while True:
+       await asyncio.sleep(MARKET_REFRESH_INTERVAL)
+       try:
+           latest = await asyncio.to_thread(get_krw_markets, rest_url)
+           if shard_id is not None:
+               latest = [m for m in latest if shard_of(m, SHARD_CONNECTIONS) == shard_id]
+           if not latest:
+               # 빈 응답으로 전체 구독을 지우지 않도록 무시
+               continue
+           current = set(markets)
+           listed = [m for m in latest if m not in current]
+           delisted = [m for m in markets if m not in set(latest)]
+           if not listed and not delisted:
+               continue
+           prices = await asyncio.to_thread(get_ticker_prices, listed, rest_url) if listed else {}
+           markets[:] = latest
+           pool.update_markets({m: prices.get(m) for m in listed}, delisted)
+           websocket = connection.get('websocket')
+           if websocket is not None:
+               await websocket.send(subscribe_message(ticket, markets))
+           print(f"[{label}] Markets updated: listed={listed}, delisted={delisted}, subscribed {len(markets)}")
+           await publish_market_events(key_prefix, listed, delisted)
+       except Exception as e:
+           print(f"[{label}] Market refresh failed: {e}")
+
+async def send_app_pings(websocket):
+   """연결이 살아 있는 동안 주기적으로 "PING"을 보내 조용한 시간에도 응답 프레임이 오게 함"""
+   try:
+       while True:
+           await asyncio.sleep(APP_PING_INTERVAL)
+           await websocket.send("PING")
+   except websockets.exceptions.ConnectionClosed:
+       pass
+
+async def upbit_ws_client(markets=None, shard_id=None, uri=UPBIT_WS_URI, seed_prices=True,
+                         exchange='upbit', rest_url=UPBIT_REST_URL):
+   """
+   웹소켓 연결 하나를 유지하며 체결을 수신 (샤드마다 별도의 큐/집계기/통계를 가짐)
+   shard_id가 None이면 단일 연결 모드
+   exchange가 'upbit'가 아니면(예: 같은 SIMPLE 포맷을 쓰는 빗썸) Redis 키와 로그 이름 앞에 거래소 이름을 붙임
+   """
+   # 마켓 목록 갱신 시 제자리에서 바꾸므로 복사해서 사용
+   markets = list(krw_markets if markets is None else markets)
+   label = "main" if shard_id is None else f"shard-{shard_id}"
+   ticket = f"{exchange}-{label}"
+   key_prefix = ''
+   if exchange != 'upbit':
+       label = f"{exchange}-{label}"
+       key_prefix = f"{exchange}:"
+   seed = get_ticker_prices(markets, rest_url) if seed_prices else {}
+   # 백필 요청 한도는 프로세스마다 하나를 함께 쓰고 샤드 프로세스 수로 나누므로, 백필 시간은 전체 마켓 수 / 전체 한도
+   ttl = late_trade_ttl(len(markets) * max(SHARD_CONNECTIONS, 1))
+   backfill_rate = BACKFILL_REQUESTS_PER_SECOND / (SHARD_PROCESSES if SHARD_CONNECTIONS > 1 else 1)
+   # 처리 워커 시작 (수신 스레드/태스크보다 먼저 프로세스를 띄움)
+   if CONSUMER_PROCESSES:
+       # 처리 워커 프로세스마다 /metrics 포트를 따로 씀
+       first_slot = 1 + SHARD_PROCESSES + (shard_id or 0) * CONSUMER_WORKERS
+       use_ring = CONSUMER_HANDOFF == 'ring'
+       if use_ring and not ring_supported():
+           # 잠금 없는 링은 x86의 store 순서에 기대므로 ARM 등에서는 큐로 넘김
+           print(f"[{label}] CONSUMER_HANDOFF='ring' is not supported on {platform.machine()}, using 'queue'")
+           use_ring = False
+       pool_class = RingConsumerPool if use_ring else ProcessConsumerPool
+       pool = pool_class(label, markets, seed, key_prefix, CONSUMER_WORKERS, first_slot, ttl)
+   else:
+       pool = ConsumerPool(label, markets, seed, key_prefix, CONSUMER_WORKERS, ttl)
+   consumer_tasks = pool.start()
+   await start_metrics_endpoint()
+   exchange_to_receive = METRICS.histogram(
+       'ingest_exchange_to_receive_seconds', "거래소 체결 시각(tms) -> 웹소켓 수신", connection=label)
+   outages = METRICS.histogram('ws_outage_seconds', "끊기기 전 마지막 프레임 -> 재연결 후 첫 프레임", connection=label)
+   reconnects = METRICS.counter('ws_reconnects_total', "웹소켓 재연결 횟수", connection=label)
+   tracker = TradeTracker()
+   backfill_task = None
+   journal = FrameJournal(os.path.join(JOURNAL_DIR, label)) if JOURNAL_DIR else None
+   connection = dict()  # 현재 연결 (마켓 목록 갱신 시 같은 연결로 다시 구독)
+   refresh_task = asyncio.create_task(refresh_markets(markets, shard_id, pool, connection, ticket,
+                                                      label, key_prefix, rest_url))
    
+   attempt = 0
+   last_frame = time.monotonic()
+   outage_started = None  # 끊기기 전 마지막 프레임 시각 (끊겨 있는 동안만 설정)
    while True:
        try:
-           async with websockets.connect(uri) as websocket:
-               subscribe_fmt = [
-                   {"ticket":"test"},
-                   {
-                       "type": "trade",
-                       "codes": krw_markets,
-                       "isOnlyRealtime": True
-                   },
-                   {"format": "SIMPLE"}
-               ]
-               await websocket.send(orjson.dumps(subscribe_fmt))
+           async with websockets.connect(uri, ping_interval=WS_PING_INTERVAL, ping_timeout=WS_PING_TIMEOUT,
+                                         close_timeout=WS_CLOSE_TIMEOUT) as websocket:
+               # 재연결할 때도 현재 마켓 목록으로 다시 구독
+               await websocket.send(subscribe_message(ticket, markets))
+               connection['websocket'] = websocket
+               print(f"[{label}] Subscribed {len(markets)} markets")
+               
+               # 재연결이면 끊겨 있던 동안의 체결을 수신과 동시에 REST로 채움
+               # 이전 백필이 아직 돌고 있으면 구간을 밀린 목록에 남겨 두고, 그 백필이 끝난 뒤 이어서 채움
+               gap = tracker.take_gap(markets)
+               if BACKFILL_ON_RECONNECT and gap:
+                   tracker.add_gap(gap)
+                   if backfill_task is None or backfill_task.done():
+                       backfill_task = asyncio.create_task(backfill_pending(
+                           tracker, pool.put_nowait, backfill_rate, label=label, url=f"{rest_url}/trades/ticks",
+                           retain_seconds=ttl))
                
-               while True:
-                   try:
-                       data = await websocket.recv()
-                       data = orjson.loads(data.decode('utf8'))
-                       
-                       if queue.full():
-                           print("Queue is full! Data might be lost.")
-                       else:
-                           await queue.put(data)
+               ping_task = asyncio.create_task(send_app_pings(websocket))
+               try:
+                   while True:
+                       try:
+                           frame = await asyncio.wait_for(websocket.recv(), RECV_IDLE_TIMEOUT)
+                       except asyncio.TimeoutError:
+                           # half-open 연결: 예외 없이 recv()가 영원히 기다리는 경우
+                           print(f"[{label}] No frames for {RECV_IDLE_TIMEOUT}s, reconnecting")
+                           break
+                       last_frame = time.monotonic()
+                       recv_ns = time.time_ns()
+                       if outage_started is not None:
+                           print(f"[{label}] Recovered after {last_frame - outage_started:.2f}s outage")
+                           outages.record((last_frame - outage_started) * 1e6)
+                           outage_started = None
+                           attempt = 0
+                       if frame[:9] in STATUS_FRAMES:
+                           continue
+                       try:
+                           if journal is not None:
+                               journal.append(frame, recv_ns)
+                           trade = decode_trade(frame)
+                           trade.rts = recv_ns
+                           exchange_to_receive.record(recv_ns // 1000 - trade.tms * 1000)
                            
-                   except websockets.exceptions.ConnectionClosed:
-                       print("WebSocket connection closed. Attempting to reconnect...")
-                       break
-                   except Exception as e:
-                       print(f"Error receiving message: {e}")
-                       continue
+                           # 백필로 이미 넣은 체결은 건너뜀
+                           if not tracker.seen(trade):
+                               continue
+                           # 가득 찬 경우의 처리(버림/합침/디스크 기록)는 큐 정책이 담당하고 카운터로 남김
+                           pool.put_nowait(trade)
+                       except Exception as e:
+                           print(f"[{label}] Error receiving message: {e}")
+               finally:
+                   ping_task.cancel()
+                   connection['websocket'] = None
+       except websockets.exceptions.ConnectionClosed:
+           print(f"[{label}] WebSocket connection closed. Attempting to reconnect...")
        except Exception as e:
-           print(f"Connection error: {e}")
-           await asyncio.sleep(5)
+           print(f"[{label}] Connection error: {e}")
+       tracker.mark_disconnected()
+       reconnects.inc()
+       if outage_started is None:
+           outage_started = last_frame
+       delay = reconnect_delay(attempt)
+       attempt += 1
+       await asyncio.sleep(delay)
+
+async def run_shards(shards):
+   """한 프로세스 안에서 여러 샤드 연결을 동시에 실행 (각 샤드는 독립적으로 재연결)"""
+   await asyncio.gather(*(upbit_ws_client(markets, shard_id) for shard_id, markets in shards))
+
+def run_shard_worker(worker_id, shards):
+   """샤드 워커 프로세스 진입점"""
+   global r, ra, metrics_slot
+   # 부모 프로세스의 Redis 연결을 공유하지 않도록 새로 연결
+   r = connect_redis()
+   ra = None
+   metrics_slot = 1 + worker_id
+   print(f"[worker-{worker_id}] shards={[shard_id for shard_id, _ in shards]}")
+   loop_runner.run(run_shards(shards), name=f"worker-{worker_id}")
+
+def main():
+   global krw_markets, r
+   krw_markets = get_krw_markets()
+   try:
+       r = connect_redis()
+   except Exception as e:
+       print(f"Redis connection failed: {e}")
+
+   if SHARD_CONNECTIONS <= 1:
+       loop_runner.run(upbit_ws_client())
+       return
+
+   # 샤드 i는 워커 프로세스 i % SHARD_PROCESSES 에 배치
+   shards = split_markets(krw_markets, SHARD_CONNECTIONS)
+   assignments = dict()
+   for worker_id in range(SHARD_PROCESSES):
+       assignments[worker_id] = [(shard_id, shards[shard_id])
+                                 for shard_id in range(SHARD_CONNECTIONS)
+                                 if shard_id % SHARD_PROCESSES == worker_id and shards[shard_id]]
+
+   workers = dict()
+   while True:
+       # 죽은 워커 프로세스는 같은 샤드 구성으로 다시 시작
+       for worker_id, assigned in assignments.items():
+           worker = workers.get(worker_id)
+           if assigned and (worker is None or not worker.is_alive()):
+               if worker is not None:
+                   print(f"[worker-{worker_id}] exited with {worker.exitcode}, restarting")
+               # 데몬 프로세스는 자식 프로세스를 만들 수 없으므로 처리 워커 프로세스를 쓰면 daemon=False
+               worker = multiprocessing.Process(target=run_shard_worker, args=(worker_id, assigned),
+                                                daemon=not CONSUMER_PROCESSES)
+               worker.start()
+               workers[worker_id] = worker
+       time.sleep(5)
 
-asyncio.run(upbit_ws_client())
\ No newline at end of file
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+거래소 SIMPLE 포맷 웹소켓 프레임 디코더 (trade / ticker / orderbook)
+
+수신한 bytes를 그대로 디코더에 넘기고(utf8 디코딩 복사 생략), 실제로 쓰는 필드만
+__slots__ 객체로 옮긴다. 숫자 필드는 여기서 한 번만 float로 변환하므로
+이후 처리부는 문자열 키 조회 대신 속성 접근(trade.tms, trade.cd, ...)을 쓴다.
+
+msgspec이 설치되어 있으면 체결(Trade)은 프레임 bytes에서 필요한 필드만 바로
+구조체로 디코딩하고, 나머지 필드는 dict를 만들지 않고 건너뛴다. 없으면 orjson을 쓴다.
+"""
+
+from typing import Optional
+
+import orjson
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class _TradeMethods:
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['cd'], data['tms'], float(data['tp']), float(data['tv']), data['ab'], data.get('sid'))
+
+    def to_tuple(self):
+        return (self.cd, self.tms, self.tp, self.tv, self.ab, self.sid, self.rts)
+
+
+if msgspec is not None:
+    class Trade(_TradeMethods, msgspec.Struct, gc=False):
+        """체결 (SIMPLE: cd, tms, tp, tv, ab, sid)"""
+        cd: str                     # 마켓 코드
+        tms: int                    # 체결 타임스탬프(ms)
+        tp: float                   # 체결 가격
+        tv: float                   # 체결량
+        ab: str                     # 'ASK' 매도 / 'BID' 매수
+        sid: Optional[int] = None   # 체결 번호 (sequential_id)
+        rts: int = 0                # 수신 시각(ns), 프레임에는 없고 수신 루프가 채움 (0이면 모름)
+
+    _trade_decoder = msgspec.json.Decoder(Trade)
+
+    def decode_trade(frame):
+        """체결 프레임(bytes) -> Trade"""
+        return _trade_decoder.decode(frame)
+else:
+    class Trade(_TradeMethods):
+        """체결 (SIMPLE: cd, tms, tp, tv, ab, sid)"""
+        __slots__ = ('cd', 'tms', 'tp', 'tv', 'ab', 'sid', 'rts')
+
+        def __init__(self, cd, tms, tp, tv, ab, sid=None, rts=0):
+            self.cd = cd      # 마켓 코드
+            self.tms = tms    # 체결 타임스탬프(ms)
+            self.tp = tp      # 체결 가격
+            self.tv = tv      # 체결량
+            self.ab = ab      # 'ASK' 매도 / 'BID' 매수
+            self.sid = sid    # 체결 번호 (sequential_id)
+            self.rts = rts    # 수신 시각(ns), 프레임에는 없고 수신 루프가 채움 (0이면 모름)
+
+        def __repr__(self):
+            return f"Trade({self.cd}, tms={self.tms}, tp={self.tp}, tv={self.tv}, ab={self.ab}, sid={self.sid})"
+
+    def decode_trade(frame):
+        """체결 프레임(bytes) -> Trade"""
+        return Trade.from_dict(orjson.loads(frame))
+
+
+class Ticker:
+    """현재가 (SIMPLE: cd, tms, tp, op, hp, lp, pcp, scr, atv24h, atp24h)"""
+    __slots__ = ('cd', 'tms', 'tp', 'op', 'hp', 'lp', 'pcp', 'scr', 'atv24h', 'atp24h')
+
+    def __init__(self, cd, tms, tp, op, hp, lp, pcp, scr, atv24h, atp24h):
+        self.cd = cd
+        self.tms = tms
+        self.tp = tp          # 현재가
+        self.op = op          # 시가
+        self.hp = hp          # 고가
+        self.lp = lp          # 저가
+        self.pcp = pcp        # 전일 종가
+        self.scr = scr        # 부호 있는 변화율
+        self.atv24h = atv24h  # 24시간 누적 거래량
+        self.atp24h = atp24h  # 24시간 누적 거래대금
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['cd'], data['tms'], float(data['tp']), float(data['op']), float(data['hp']),
+                   float(data['lp']), float(data['pcp']), float(data['scr']),
+                   float(data['atv24h']), float(data['atp24h']))
+
+
+class Orderbook:
+    """호가 (SIMPLE: cd, tms, tas, tbs, obu[ap, bp, as, bs])"""
+    __slots__ = ('cd', 'tms', 'tas', 'tbs', 'asks', 'bids')
+
+    def __init__(self, cd, tms, tas, tbs, asks, bids):
+        self.cd = cd
+        self.tms = tms
+        self.tas = tas    # 총 매도 잔량
+        self.tbs = tbs    # 총 매수 잔량
+        self.asks = asks  # [(가격, 잔량), ...] 최우선 호가부터
+        self.bids = bids
+
+    @classmethod
+    def from_dict(cls, data):
+        units = data['obu']
+        return cls(data['cd'], data['tms'], float(data['tas']), float(data['tbs']),
+                   [(float(unit['ap']), float(unit['as'])) for unit in units],
+                   [(float(unit['bp']), float(unit['bs'])) for unit in units])
+
+    @property
+    def best_ask(self):
+        return self.asks[0][0] if self.asks else None
+
+    @property
+    def best_bid(self):
+        return self.bids[0][0] if self.bids else None
+
+
+DECODERS = {
+    'trade': Trade.from_dict,
+    'ticker': Ticker.from_dict,
+    'orderbook': Orderbook.from_dict,
+}
+
+
+def decode(frame):
+    """프레임(bytes) -> Trade/Ticker/Orderbook, 상태 메시지 등 알 수 없는 프레임은 None"""
+    data = orjson.loads(frame)
+    decoder = DECODERS.get(data.get('ty'))
+    return decoder(data) if decoder is not None else None